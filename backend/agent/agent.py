@@ -1,98 +1,360 @@
+import asyncio
 import logging
-from typing import List, Dict, Any
+import hashlib
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from .tools import (
     fetch_emails,
     analyze_newsletters,
     summarize_newsletters,
-    format_digest
+    classify_and_summarize,
+    format_digest,
+    afetch_emails,
+    aanalyze_newsletters,
+    asummarize_newsletters,
+    aclassify_and_summarize,
+    aformat_digest,
+    aiter_email_chunks,
+    list_message_ids
 )
-from .llm import plan_next_step
-from .tool_manifests import TOOL_MANIFESTS
+from .llm import MODEL_NAME, deterministic_plan, plan_next_step, planner_prompt_prefix, stream_markdown_digest
+from .tool_manifests import TOOL_MANIFESTS, PLANNER_TOOLS, TOOL_MANIFESTS_JSON
+from .cache import DiskCache
 import os
 
 # Get logger for this module
 logger = logging.getLogger(__name__)
 
-# Log the start of a new session
-logger.info("Starting new logging session")
+# Log the start of a new session, once per process even if the module is reloaded
+if not globals().get('_SESSION_LOGGED', False):
+    logger.info("Starting new logging session")
+    _SESSION_LOGGED = True
+
+@dataclass(slots=True)
+class AgentState:
+    """State of a pipeline run. Tool manifests read and write these attributes by name."""
+    email_count: int
+    emails: List[Dict[str, Any]] = field(default_factory=list)
+    newsletters: List[Dict[str, Any]] = field(default_factory=list)
+    summarized_newsletters: List[Dict[str, Any]] = field(default_factory=list)
+    newsletters_filtered: List[Dict[str, Any]] = field(default_factory=list)
+    summarized_newsletters_filtered: List[Dict[str, Any]] = field(default_factory=list)
+    digest: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a shallow dictionary view of the state, e.g. for the LLM planner."""
+        return {f.name: getattr(self, f.name) for f in fields(self)}
 
 # Define available tools and their functions
 TOOLS = {
     'fetch_emails': {
         'function': fetch_emails,
+        'async_function': afetch_emails,
+        # Yields the emails in chunks, for the overlapped static pipeline
+        'stream_function': aiter_email_chunks,
         'manifest': TOOL_MANIFESTS['fetch_emails']
     },
     'analyze_newsletters': {
         'function': analyze_newsletters,
+        'async_function': aanalyze_newsletters,
         'manifest': TOOL_MANIFESTS['analyze_newsletters']
     },
     'summarize_newsletters': {
         'function': summarize_newsletters,
+        'async_function': asummarize_newsletters,
         'manifest': TOOL_MANIFESTS['summarize_newsletters']
     },
+    'classify_and_summarize': {
+        'function': classify_and_summarize,
+        'async_function': aclassify_and_summarize,
+        'manifest': TOOL_MANIFESTS['classify_and_summarize']
+    },
     'format_digest': {
         'function': format_digest,
+        'async_function': aformat_digest,
         'manifest': TOOL_MANIFESTS['format_digest']
     }
 }
 
-def prepare_tool_params(tool_name: str, state: Dict[str, Any], email_count: int) -> Dict[str, Any]:
+# Serializable version of the tools for the LLM planner, built once in tool_manifests
+_TOOLS_FOR_LLM = {name: PLANNER_TOOLS[name] for name in TOOLS}
+_TOOLS_FOR_LLM_JSON = (
+    TOOL_MANIFESTS_JSON if _TOOLS_FOR_LLM == PLANNER_TOOLS
+    else json.dumps(_TOOLS_FOR_LLM, sort_keys=True, separators=(',', ':'))
+)
+
+# Manifest filters keyed by the state slot they apply to, as (field, value) pairs.
+# The filtered view of a slot is computed once when it is written and stored as '<slot>_filtered'.
+_STATE_FILTERS = {
+    param_name: (param_info['filter']['field'], param_info['filter']['value'])
+    for tool in TOOLS.values()
+    for param_name, param_info in tool['manifest']['input_params'].items()
+    if param_info.get('filter')
+}
+
+# Input parameters of each tool as (param_name, state attribute to read) pairs,
+# resolved once from the manifests so parameter preparation needs no manifest lookups
+_PARAM_SPEC = {
+    name: tuple(
+        (param_name, f"{param_name}_filtered" if param_info.get('filter') else param_name)
+        for param_name, param_info in tool['manifest']['input_params'].items()
+    )
+    for name, tool in TOOLS.items()
+}
+
+# Fixed tool order used when the LLM planner is disabled.
+# The first two steps run overlapped, see arun_fetch_and_classify.
+_PIPELINE = ('fetch_emails', 'classify_and_summarize', 'format_digest')
+
+# Fetched chunks waiting for classification before fetching pauses
+PIPELINE_QUEUE_SIZE = 16
+
+# Set USE_LLM_PLANNER=true to let the LLM choose each step instead
+USE_LLM_PLANNER = os.environ.get('USE_LLM_PLANNER', 'false').lower() in ('1', 'true', 'yes')
+
+# State slots whose presence determines the pipeline phase
+STATE_PHASE_KEYS = ('emails', 'newsletters', 'summarized_newsletters', 'digest')
+
+# LLM planner decisions keyed by state-phase fingerprint, persisted between runs.
+# Keys include a hash of the tools, their manifests and the planner prompt, so
+# plans made with an earlier version of any of them are not reused
+_PLANNER_HASH = hashlib.sha256('\x00'.join((
+    MODEL_NAME,
+    ','.join(sorted(TOOLS.keys())),
+    TOOL_MANIFESTS_JSON,
+    planner_prompt_prefix(_TOOLS_FOR_LLM_JSON)
+)).encode('utf-8')).hexdigest()
+_PLAN_CACHE = DiskCache('plans', memory_size=len(STATE_PHASE_KEYS) + 1)
+
+# Runs speculative planner calls while the current tool executes
+_PLANNER_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='planner')
+
+# Digests keyed by email count and the set of message IDs they were built from
+DIGEST_CACHE_TTL = 3600
+_DIGEST_CACHE = DiskCache('digests', ttl=DIGEST_CACHE_TTL)
+
+EMPTY_DIGEST = "# Newsletter Digest\n\nNo newsletters found in the analyzed emails."
+
+def _fingerprint_key(fingerprint: Tuple[bool, ...]) -> str:
+    """Encode a state-phase fingerprint as a JSON-friendly string key."""
+    return ''.join('1' if populated else '0' for populated in fingerprint)
+
+def plan_cache_key(fingerprint: Tuple[bool, ...]) -> str:
+    """Build the plan cache key for a state phase, under the current planner hash."""
+    return f"{_PLANNER_HASH}:{_fingerprint_key(fingerprint)}"
+
+def state_fingerprint(state: AgentState) -> Tuple[bool, ...]:
+    """
+    Compute the pipeline phase of the state from which slots are populated.
+    
+    Args:
+        state (AgentState): Current state of the agent
+        
+    Returns:
+        Tuple[bool, ...]: One flag per entry in STATE_PHASE_KEYS
+    """
+    return tuple(bool(getattr(state, key)) for key in STATE_PHASE_KEYS)
+
+def get_plan(state: AgentState) -> Dict[str, Any]:
+    """
+    Get the next step for the current state, asking the LLM only on a cache miss.
+    
+    The rule-based planner is consulted first, so cached LLM decisions only
+    cover phases it cannot decide.
+    
+    Args:
+        state (AgentState): Current state of the agent
+        
+    Returns:
+        Dict[str, Any]: Planned next step
+    """
+    plan = deterministic_plan(state.to_dict(), _TOOLS_FOR_LLM)
+    if plan is not None:
+        return plan
+    
+    fingerprint = state_fingerprint(state)
+    plan = _PLAN_CACHE.get(plan_cache_key(fingerprint))
+    if plan is not None:
+        logger.debug("Plan cache hit for state phase %s", _fingerprint_key(fingerprint))
+        return plan
+    
+    plan = plan_next_step(state.to_dict(), _TOOLS_FOR_LLM, tools_json=_TOOLS_FOR_LLM_JSON)
+    remember_plan(fingerprint, plan)
+    return plan
+
+def remember_plan(fingerprint: Tuple[bool, ...], plan: Dict[str, Any]) -> None:
+    """
+    Store a planner decision in the plan cache if it can be acted upon.
+    
+    Args:
+        fingerprint (Tuple[bool, ...]): State phase the plan was made for
+        plan (Dict[str, Any]): Planner decision
+    """
+    if plan['is_complete'] or plan['tool'] in TOOLS:
+        _PLAN_CACHE.set(plan_cache_key(fingerprint), plan)
+
+def plan_ahead(state: AgentState, tool_name: str) -> Optional[Tuple[Tuple[bool, ...], Future]]:
+    """
+    Start planning the step after tool_name in the background, while the tool runs.
+    
+    Plans depend only on the state phase, so the planner is shown the current
+    state with the slots the tool writes marked as pending.
+    
+    Args:
+        state (AgentState): State before the tool runs
+        tool_name (str): Name of the tool about to be executed
+        
+    Returns:
+        Optional[Tuple[Tuple[bool, ...], Future]]: Expected phase after the tool and the
+            pending plan, or None if that phase needs no planner call
+    """
+    state_updates = TOOLS[tool_name]['manifest']['state_requirements']['writes']
+    expected = tuple(
+        populated or key in state_updates
+        for key, populated in zip(STATE_PHASE_KEYS, state_fingerprint(state))
+    )
+    # A digest ends the loop without planning
+    if 'digest' in state_updates:
+        return None
+    
+    predicted_state = state.to_dict()
+    for state_key in state_updates:
+        predicted_state[state_key] = f"<pending output of {tool_name}>"
+    
+    # Phases the rules decide or that are already cached need no planner call
+    if (deterministic_plan(predicted_state, _TOOLS_FOR_LLM) is not None
+            or _PLAN_CACHE.get(plan_cache_key(expected)) is not None):
+        return None
+    future = _PLANNER_POOL.submit(
+        plan_next_step, predicted_state, _TOOLS_FOR_LLM, tools_json=_TOOLS_FOR_LLM_JSON
+    )
+    return expected, future
+
+def prepare_tool_params(tool_name: str, state: AgentState, email_count: int) -> Dict[str, Any]:
     """
     Prepare tool parameters based on the tool's manifest requirements.
     
     Args:
         tool_name (str): Name of the tool to prepare parameters for
-        state (Dict[str, Any]): Current state of the agent
+        state (AgentState): Current state of the agent
         email_count (int): Number of emails to process
         
     Returns:
         Dict[str, Any]: Prepared parameters for the tool
     """
-    tool_manifest = TOOLS[tool_name]['manifest']
     tool_params = {}
     
-    for param_name, param_info in tool_manifest['input_params'].items():
+    for param_name, state_key in _PARAM_SPEC[tool_name]:
         if param_name == 'num_emails':
             tool_params[param_name] = email_count
-        elif param_name in state:
-            value = state[param_name]
-            
-            # Apply filtering if specified in the manifest
-            if param_info.get('filter'):
-                filter_info = param_info['filter']
-                if isinstance(value, list):
-                    value = [
-                        item for item in value 
-                        if item.get(filter_info['field']) == filter_info['value']
-                    ]
-            
-            tool_params[param_name] = value
+        elif hasattr(state, state_key):
+            # Filtered parameters read the partition stored by update_state
+            tool_params[param_name] = getattr(state, state_key)
                 
     return tool_params
 
-def update_state(state: Dict[str, Any], tool_name: str, result: Any) -> Dict[str, Any]:
+def update_state(state: AgentState, tool_name: str, result: Any) -> AgentState:
     """
     Update state based on the tool's manifest requirements.
     
     Args:
-        state (Dict[str, Any]): Current state
+        state (AgentState): Current state
         tool_name (str): Name of the tool that was executed
         result (Any): Result from the tool execution
         
     Returns:
-        Dict[str, Any]: Updated state
+        AgentState: Updated state
     """
     tool_manifest = TOOLS[tool_name]['manifest']
     state_updates = tool_manifest['state_requirements']['writes']
     
     for state_key in state_updates:
-        state[state_key] = result
+        setattr(state, state_key, result)
+        
+        filter_info = _STATE_FILTERS.get(state_key)
+        if filter_info and isinstance(result, list):
+            field_name, field_value = filter_info
+            setattr(state, f"{state_key}_filtered", [
+                item for item in result if item.get(field_name) == field_value
+            ])
             
     return state
 
-def invoke_agent(email_count: int) -> str:
+def nothing_left_to_digest(state: AgentState, tool_name: str) -> bool:
+    """
+    Check whether a completed step left the pipeline without anything to digest.
+    
+    Args:
+        state (AgentState): Current state
+        tool_name (str): Name of the tool that was executed
+        
+    Returns:
+        bool: True if the step produced no emails or no newsletters
+    """
+    state_updates = TOOLS[tool_name]['manifest']['state_requirements']['writes']
+    if 'newsletters' in state_updates:
+        return not state.newsletters_filtered
+    return not any(getattr(state, state_key) for state_key in state_updates)
+
+def run_tool(tool_name: str, state: AgentState, email_count: int) -> AgentState:
+    """
+    Execute a tool against the current state and record its result.
+    
+    Args:
+        tool_name (str): Name of the tool to execute
+        state (AgentState): Current state of the agent
+        email_count (int): Number of emails to process
+        
+    Returns:
+        AgentState: Updated state
+    """
+    tool_params = prepare_tool_params(tool_name, state, email_count)
+    tool_func = TOOLS[tool_name]['function']
+    
+    # Execute the tool with parameters
+    result = tool_func(**tool_params)
+    
+    # Update state based on the tool's result
+    state = update_state(state, tool_name, result)
+    
+    logger.info("Completed step: %s", tool_name)
+    return state
+
+async def arun_tool(tool_name: str, state: AgentState, email_count: int) -> AgentState:
+    """
+    Async variant of run_tool, awaiting the tool's async implementation.
+    """
+    tool_params = prepare_tool_params(tool_name, state, email_count)
+    result = await TOOLS[tool_name]['async_function'](**tool_params)
+    state = update_state(state, tool_name, result)
+    
+    logger.info("Completed step: %s", tool_name)
+    return state
+
+def finish_pipeline(state: AgentState) -> str:
     """
-    Main agent function that orchestrates the email processing pipeline using LLM for planning.
+    Log the final state and return the digest.
+    
+    Args:
+        state (AgentState): Final state of the agent
+        
+    Returns:
+        str: Markdown formatted digest of newsletters
+    """
+    logger.info("Pipeline completed successfully")
+    logger.info("Final state: emails=%d, newsletters=%d, summarized=%d, digest=%s",
+                len(state.emails), len(state.newsletters), len(state.summarized_newsletters), bool(state.digest))
+    if state.digest and logger.isEnabledFor(logging.INFO):
+        logger.info("Digest content: %s", state.digest[:100] + "..." if len(state.digest) > 100 else state.digest)
+    return state.digest or EMPTY_DIGEST
+
+def invoke_agent_static(email_count: int) -> str:
+    """
+    Run the fixed email processing pipeline without LLM planning.
+    
+    All steps run in a single event loop, see ainvoke_agent_static.
     
     Args:
         email_count (int): Number of emails to process
@@ -100,58 +362,251 @@ def invoke_agent(email_count: int) -> str:
     Returns:
         str: Markdown formatted digest of newsletters
     """
-    logger.info(f"Starting email processing pipeline for {email_count} emails")
+    return asyncio.run(ainvoke_agent_static(email_count))
+
+async def ainvoke_agent_static(email_count: int) -> str:
+    """
+    Run the fixed email processing pipeline, awaiting each tool.
+    
+    Args:
+        email_count (int): Number of emails to process
+        
+    Returns:
+        str: Markdown formatted digest of newsletters
+    """
+    logger.info("Starting static email processing pipeline for %s emails", email_count)
+    
+    try:
+        state = await arun_fetch_and_classify(AgentState(email_count=email_count), email_count)
+        if state is not None:
+            state = await arun_steps(_PIPELINE[2:], state, email_count)
+        return EMPTY_DIGEST if state is None else finish_pipeline(state)
+        
+    except Exception as e:
+        logger.error("Error in invoke_agent_static: %s", e)
+        raise
+
+async def arun_steps(tool_names: Tuple[str, ...], state: AgentState, email_count: int) -> Optional[AgentState]:
+    """
+    Run tools in order, stopping early once no newsletters are left to digest.
+    
+    Args:
+        tool_names (Tuple[str, ...]): Names of the tools to run
+        state (AgentState): Current state of the agent
+        email_count (int): Number of emails to process
+        
+    Returns:
+        Optional[AgentState]: State after the last tool, or None if there is nothing to digest
+    """
+    for tool_name in tool_names:
+        state = await arun_tool(tool_name, state, email_count)
+        
+        if nothing_left_to_digest(state, tool_name):
+            logger.info("No newsletters left to digest after %s", tool_name)
+            return None
+    return state
+
+async def arun_fetch_and_classify(state: AgentState, email_count: int) -> Optional[AgentState]:
+    """
+    Run fetch_emails and classify_and_summarize as a producer/consumer pipeline.
+    
+    Emails are fetched in chunks and queued for classification as soon as they
+    arrive, so the LLM calls for one chunk overlap with fetching the next.
+    
+    Args:
+        state (AgentState): Current state of the agent
+        email_count (int): Number of emails to process
+        
+    Returns:
+        Optional[AgentState]: State after both steps, or None if there is nothing to digest
+    """
+    fetch_chunks = TOOLS['fetch_emails']['stream_function']
+    classify = TOOLS['classify_and_summarize']['async_function']
+    queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    
+    async def produce():
+        try:
+            async for chunk in fetch_chunks(num_emails=email_count):
+                await queue.put(chunk)
+        finally:
+            # Always signal the end, so the consumer does not wait forever on a failed fetch
+            await queue.put(None)
+    
+    async def consume():
+        emails = []
+        while (chunk := await queue.get()) is not None:
+            emails.extend(await classify(emails=chunk))
+        return emails
+    
+    _, emails = await asyncio.gather(produce(), consume())
+    
+    for tool_name in _PIPELINE[:2]:
+        # classify_and_summarize flags the fetched emails in place, so both steps record the same list
+        state = update_state(state, tool_name, emails)
+        logger.info("Completed step: %s", tool_name)
+        
+        if nothing_left_to_digest(state, tool_name):
+            logger.info("No newsletters left to digest after %s", tool_name)
+            return None
+    return state
+
+def invoke_agent_llm(email_count: int) -> str:
+    """
+    Orchestrate the email processing pipeline using LLM for planning.
+    
+    Args:
+        email_count (int): Number of emails to process
+        
+    Returns:
+        str: Markdown formatted digest of newsletters
+    """
+    logger.info("Starting email processing pipeline for %s emails", email_count)
     
     try:
-        # Initialize state
-        state = {
-            'emails': [],
-            'newsletters': [],
-            'summarized_newsletters': [],
-            'digest': None,
-            'email_count': email_count
-        }
-        
-        # Create a serializable version of tools for the LLM
-        tools_for_llm = {
-            name: {
-                'description': tool['manifest']['description'],
-                'input_params': tool['manifest']['input_params'],
-                'output_params': tool['manifest']['output_params']
-            }
-            for name, tool in TOOLS.items()
-        }
+        state = AgentState(email_count=email_count)
         
         # Main processing loop
         while True:
             # Plan next step
-            plan = plan_next_step(state, tools_for_llm)
-            logger.info(f"Planned next step: {plan['tool']} - {plan['reason']}")
+            plan = get_plan(state)
+            logger.info("Planned next step: %s - %s", plan['tool'], plan['reason'])
             
             if plan['is_complete']:
-                logger.info("Pipeline completed successfully")
-                logger.info(f"Final state: emails={len(state['emails'])}, newsletters={len(state['newsletters'])}, summarized={len(state['summarized_newsletters'])}, digest={bool(state['digest'])}")
-                if state['digest']:
-                    logger.info("Digest content: %s", state['digest'][:100] + "..." if len(state['digest']) > 100 else state['digest'])
-                return state['digest'] or "# Newsletter Digest\n\nNo newsletters found in the analyzed emails."
+                return finish_pipeline(state)
             
             if not plan['tool'] or plan['tool'] not in TOOLS:
-                logger.error(f"Invalid tool selected: {plan['tool']}")
+                logger.error("Invalid tool selected: %s", plan['tool'])
                 raise ValueError(f"Invalid tool selected: {plan['tool']}")
             
-            # Get the tool function and prepare parameters
             tool_name = plan['tool']
-            tool_params = prepare_tool_params(tool_name, state, email_count)
-            tool_func = TOOLS[tool_name]['function']
+            speculation = plan_ahead(state, tool_name)
+            state = run_tool(tool_name, state, email_count)
             
-            # Execute the tool with parameters
-            result = tool_func(**tool_params)
+            # A digest ends the pipeline, no need to ask the planner
+            if state.digest:
+                return finish_pipeline(state)
             
-            # Update state based on the tool's result
-            state = update_state(state, tool_name, result)
+            # The same phase would be planned again, so stop here
+            if nothing_left_to_digest(state, tool_name):
+                logger.info("No newsletters left to digest after %s", tool_name)
+                return EMPTY_DIGEST
             
-            logger.info(f"Completed step: {tool_name}")
+            # Use the speculative plan only if the tool produced the expected phase
+            if speculation is not None:
+                expected, future = speculation
+                if state_fingerprint(state) == expected:
+                    remember_plan(expected, future.result())
             
     except Exception as e:
-        logger.error(f"Error in invoke_agent: {str(e)}")
-        raise 
\ No newline at end of file
+        logger.error("Error in invoke_agent_llm: %s", e)
+        raise
+
+def digest_cache_key(email_count: int, message_ids: List[str]) -> str:
+    """
+    Build the digest cache key for a run over the given messages.
+    
+    Args:
+        email_count (int): Number of emails requested
+        message_ids (List[str]): IDs of the messages the digest is built from
+        
+    Returns:
+        str: SHA-256 hex digest
+    """
+    raw = f"{email_count}|" + ",".join(sorted(message_ids))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def invoke_agent(email_count: int) -> str:
+    """
+    Main agent function that runs the email processing pipeline.
+    
+    Uses the fixed tool order unless USE_LLM_PLANNER is enabled. Digests are
+    cached for DIGEST_CACHE_TTL seconds, so the pipeline only runs again when
+    the latest messages change.
+    
+    Args:
+        email_count (int): Number of emails to process
+        
+    Returns:
+        str: Markdown formatted digest of newsletters
+    """
+    cache_key, digest = lookup_digest(email_count)
+    if digest is not None:
+        return digest
+    
+    if USE_LLM_PLANNER:
+        digest = invoke_agent_llm(email_count)
+    else:
+        digest = invoke_agent_static(email_count)
+    
+    store_digest(cache_key, digest)
+    return digest
+
+def lookup_digest(email_count: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Look up the cached digest for the latest messages.
+    
+    Args:
+        email_count (int): Number of emails to process
+        
+    Returns:
+        Tuple[Optional[str], Optional[str]]: Digest cache key, or None if messages could
+            not be listed, and the cached digest, or None on a miss
+    """
+    try:
+        cache_key = digest_cache_key(email_count, list_message_ids(email_count))
+    except Exception as e:
+        logger.warning("Could not list messages for the digest cache: %s", e)
+        return None, None
+    
+    digest = _DIGEST_CACHE.get(cache_key)
+    if digest is not None:
+        logger.info("Returning cached digest, messages are unchanged")
+    return cache_key, digest
+
+def store_digest(cache_key: Optional[str], digest: str) -> None:
+    """
+    Cache a digest under the key returned by lookup_digest.
+    
+    Args:
+        cache_key (Optional[str]): Digest cache key, or None if the digest cannot be cached
+        digest (str): Markdown formatted digest of newsletters
+    """
+    # Empty digests may come from failed LLM calls, so only real ones are kept
+    if cache_key is not None and digest != EMPTY_DIGEST:
+        _DIGEST_CACHE.set(cache_key, digest)
+
+def stream_agent(email_count: int) -> Iterator[str]:
+    """
+    Run the email processing pipeline like invoke_agent, yielding the digest as it is generated.
+    
+    The static pipeline streams the final digest from Gemini. Cached digests and
+    digests from the LLM planner are yielded whole.
+    
+    Args:
+        email_count (int): Number of emails to process
+        
+    Yields:
+        str: Consecutive pieces of the markdown digest
+    """
+    cache_key, digest = lookup_digest(email_count)
+    if digest is None and USE_LLM_PLANNER:
+        digest = invoke_agent_llm(email_count)
+        store_digest(cache_key, digest)
+    if digest is not None:
+        yield digest
+        return
+    
+    logger.info("Starting streamed email processing pipeline for %s emails", email_count)
+    state = asyncio.run(arun_fetch_and_classify(AgentState(email_count=email_count), email_count))
+    if state is None:
+        yield EMPTY_DIGEST
+        return
+    
+    newsletters = prepare_tool_params('format_digest', state, email_count)['summarized_newsletters']
+    parts = []
+    for part in stream_markdown_digest(newsletters):
+        parts.append(part)
+        yield part
+    
+    state.digest = ''.join(parts)
+    store_digest(cache_key, finish_pipeline(state))
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .serialization import json_loads, json_dumps
+
+logger = logging.getLogger(__name__)
+
+# Directory for persistent caches, shared by all backend processes
+CACHE_DIR = os.path.expanduser(os.environ.get('EAG3_CACHE_DIR', '~/.cache/eag3'))
+
+class DiskCache:
+    """
+    Persistent key-value cache stored in a SQLite database.
+
+    Values must be JSON serializable. Each operation uses its own connection,
+    so one instance can be shared between threads and SQLite's file locking
+    keeps concurrent processes consistent. Optionally, recently used entries
+    are also kept in memory so hot lookups skip SQLite.
+    """
+
+    def __init__(self, name: str, ttl: Optional[int] = None, memory_size: int = 0):
+        """
+        Args:
+            name (str): Cache name, used as the database file name
+            ttl (Optional[int]): Seconds before an entry expires, or None to keep entries forever
+            memory_size (int): Number of recently used entries kept in memory, 0 to disable
+        """
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite")
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_lock = threading.Lock()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, ts REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _expired(self, ts: float) -> bool:
+        return self.ttl is not None and time.time() - ts > self.ttl
+
+    def _remember(self, key: str, value: Any, ts: float) -> None:
+        """Keep an entry in the in-memory layer, evicting the least recently used one."""
+        if not self.memory_size:
+            return
+        with self._memory_lock:
+            self._memory[key] = (value, ts)
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Look up a cached value.
+
+        Args:
+            key (str): Cache key
+            default (Any): Value returned on a miss
+
+        Returns:
+            Any: Cached value, or default if missing or expired
+        """
+        if self.memory_size:
+            with self._memory_lock:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+            if entry is not None and not self._expired(entry[1]):
+                return entry[0]
+
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value, ts FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Error reading cache %s: %s", self.path, e)
+            return default
+
+        if row is None or self._expired(row[1]):
+            return default
+        value = json_loads(row[0])
+        self._remember(key, value, row[1])
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store a value in the cache.
+
+        Args:
+            key (str): Cache key
+            value (Any): JSON serializable value
+        """
+        ts = time.time()
+        self._remember(key, value, ts)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, ts) VALUES (?, ?, ?)",
+                    (key, json_dumps(value), ts)
+                )
+        except sqlite3.Error as e:
+            logger.warning("Error writing cache %s: %s", self.path, e)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        Look up several cached values with one query per chunk of keys.
+
+        Args:
+            keys (List[str]): Cache keys
+
+        Returns:
+            Dict[str, Any]: Cached values by key, leaving out missing and expired entries
+        """
+        found = {}
+        missing = []
+        if self.memory_size:
+            with self._memory_lock:
+                for key in keys:
+                    entry = self._memory.get(key)
+                    if entry is not None and not self._expired(entry[1]):
+                        self._memory.move_to_end(key)
+                        found[key] = entry[0]
+                    else:
+                        missing.append(key)
+        else:
+            missing = list(keys)
+
+        try:
+            with self._connect() as conn:
+                for start in range(0, len(missing), _GET_MANY_CHUNK):
+                    chunk = missing[start:start + _GET_MANY_CHUNK]
+                    rows = conn.execute(
+                        f"SELECT key, value, ts FROM cache WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for key, value, ts in rows:
+                        if not self._expired(ts):
+                            found[key] = json_loads(value)
+                            self._remember(key, found[key], ts)
+        except sqlite3.Error as e:
+            logger.warning("Error reading cache %s: %s", self.path, e)
+        return found
+
+    def set_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """
+        Store several values in one transaction.
+
+        Args:
+            items (Iterable[Tuple[str, Any]]): (key, value) pairs with JSON serializable values
+        """
+        ts = time.time()
+        rows = []
+        for key, value in items:
+            self._remember(key, value, ts)
+            rows.append((key, json_dumps(value), ts))
+        if not rows:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO cache (key, value, ts) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.warning("Error writing cache %s: %s", self.path, e)
+
+# Keys per SELECT in get_many, below SQLite's limit on bound parameters
+_GET_MANY_CHUNK = 500
+
+# Version of the per-email results. Bump it when the model or the classification
+# and summary prompts change, so results produced by the old ones are not reused.
+RESULTS_VERSION = 1
+
+def email_cache_key(email: Dict[str, Any]) -> str:
+    """
+    Build a cache key identifying an email by sender, subject and content, for RESULTS_VERSION.
+
+    Args:
+        email (Dict[str, Any]): Email dictionary with subject, from and content
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    raw = '\x00'.join((
+        str(RESULTS_VERSION), email.get('from', ''), email.get('subject', ''), email.get('content', '')
+    ))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+# Per-email LLM results, shared by every tool that classifies or summarizes newsletters
+VERDICT_CACHE = DiskCache('newsletter_verdicts')
+SUMMARY_CACHE = DiskCache('newsletter_summaries')
@@ -1,12 +1,21 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+import asyncio
 import os
 from dotenv import load_dotenv
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Optional
+import hashlib
 import json
 import sys
-import os
 import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from .cache import DiskCache, VERDICT_CACHE, email_cache_key
+from .tool_manifests import TOOL_MANIFESTS, PLANNER_TOOLS, TOOL_MANIFESTS_JSON
+from .serialization import json_loads, json_dumps
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -17,19 +26,322 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini
-api_key = os.getenv('GOOGLE_API_KEY')
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables")
+MODEL_NAME = 'gemini-2.0-flash'
+
+# Gemini client transport ('grpc' or 'rest'); unset leaves the SDK default, gRPC,
+# which multiplexes concurrent calls over one HTTP/2 connection
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT') or None
+
+@lru_cache(maxsize=1)
+def get_model():
+    """
+    Configure Gemini and create the model on first use.
+    
+    Deferred so that importing this module does no setup work and does not
+    fail when GOOGLE_API_KEY is missing, e.g. when every response is cached.
+    
+    Returns:
+        The shared GenerativeModel instance
+    """
+    api_key = os.getenv('GOOGLE_API_KEY')
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+    
+    logger.info("Configuring Gemini API...")
+    try:
+        # One client, and so one pooled connection, is shared by every call
+        genai.configure(api_key=api_key, transport=GEMINI_TRANSPORT)
+        model = genai.GenerativeModel(MODEL_NAME)
+        logger.info("Gemini API configured successfully (transport: %s)", GEMINI_TRANSPORT or 'grpc')
+    except Exception as e:
+        logger.error("Error configuring Gemini API: %s", e)
+        raise
+    return model
+
+# Number of emails classified per LLM call, bounded by prompt size. This also
+# keeps each response to a few hundred bytes of JSON, small enough to parse
+# whole once it arrives rather than streaming it
+NEWSLETTER_BATCH_SIZE = 15
+
+# Number of newsletters summarized per LLM call. Summaries are much longer
+# than verdicts, so batches are smaller to keep responses well formed
+SUMMARY_BATCH_SIZE = 5
+
+# Characters of content kept from the start and end of each email in the
+# prompts that summarize it, see trim_content
+SUMMARY_CONTENT_HEAD = 2000
+SUMMARY_CONTENT_TAIL = 500
+
+# Upper bound on concurrent LLM calls, to stay within Gemini rate limits
+LLM_MAX_CONCURRENCY = 8
+
+# Retries for rate-limited or failed LLM calls, with exponential backoff
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 1.0
+_RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+)
+
+class RequestRateLimiter:
+    """
+    Sliding-window limit on requests per minute, shared by sync and async callers.
+    
+    Each call reserves the earliest slot that keeps at most rpm requests in any
+    60 second window and returns how long the caller has to wait for it. Slots
+    are reserved under a thread lock rather than an asyncio primitive, because
+    the tools run each pipeline in its own event loop.
+    """
+    
+    def __init__(self, rpm: int):
+        """
+        Args:
+            rpm (int): Maximum requests per minute, 0 to disable the limit
+        """
+        self.rpm = rpm
+        self._slots: deque = deque()
+        self._lock = threading.Lock()
+    
+    def reserve(self) -> float:
+        """
+        Reserve a slot for one request.
+        
+        Returns:
+            float: Seconds to wait before sending the request
+        """
+        if not self.rpm:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            while self._slots and self._slots[0] <= now - 60:
+                self._slots.popleft()
+            slot = now
+            if len(self._slots) >= self.rpm:
+                slot = max(slot, self._slots[-self.rpm] + 60)
+            if self._slots:
+                slot = max(slot, self._slots[-1])
+            self._slots.append(slot)
+            return slot - now
+    
+    def wait(self) -> None:
+        """Block until a request may be sent."""
+        delay = self.reserve()
+        if delay > 0:
+            logger.debug("Gemini rate limit reached, waiting %.1fs", delay)
+            time.sleep(delay)
+    
+    async def await_slot(self) -> None:
+        """Wait, without blocking the event loop, until a request may be sent."""
+        delay = self.reserve()
+        if delay > 0:
+            logger.debug("Gemini rate limit reached, waiting %.1fs", delay)
+            await asyncio.sleep(delay)
+
+# Gemini requests per minute allowed for this process, set to the API key's quota
+# so concurrent calls queue here instead of failing with 429s; 0 disables the limit
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', '0'))
+_RATE_LIMITER = RequestRateLimiter(GEMINI_RPM)
+
+async def generate_content_async(prompt: str):
+    """
+    Call the model asynchronously, retrying on rate limits and server errors.
+    
+    The SDK's async client is bound to the event loop it is first used in, while
+    the tools start a new loop with asyncio.run on every call. So the blocking
+    client, which is thread safe, runs in a worker thread instead; concurrent
+    calls still overlap, bounded by gather_bounded.
+    
+    Args:
+        prompt (str): Prompt to send
+        
+    Returns:
+        Response object from the model
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await _RATE_LIMITER.await_slot()
+        try:
+            return await asyncio.to_thread(get_model().generate_content, prompt)
+        except _RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = LLM_RETRY_BASE_DELAY * 2 ** attempt
+            logger.warning("LLM call failed (%s), retrying in %.1fs", type(e).__name__, delay)
+            await asyncio.sleep(delay)
+
+# Responses by normalized prompt, so repeated prompts skip the network entirely.
+# The most recently used responses are also kept in memory
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))
+_RESPONSE_CACHE = DiskCache('llm_responses', ttl=LLM_CACHE_TTL, memory_size=1000)
+
+def prompt_cache_key(prompt: str) -> str:
+    """
+    Build the response cache key for a prompt sent to MODEL_NAME.
+    
+    Whitespace runs are collapsed first, so prompts differing only in layout
+    share a key. Case is kept, since it is part of the email content.
+    """
+    normalized = _WS_RE.sub(' ', prompt).strip()
+    return hashlib.sha256(f"{MODEL_NAME}\x00{normalized}".encode('utf-8')).hexdigest()
+
+def _parse_and_store(key: str, text: str, parse: Optional[Callable[[str], Any]]) -> Any:
+    """Parse a fresh response and cache it, leaving unparseable responses uncached."""
+    if parse is not None:
+        try:
+            result = parse(text)
+        except Exception:
+            logger.error("Raw response: %s", text)
+            raise
+    else:
+        result = text
+    _RESPONSE_CACHE.set(key, text)
+    return result
+
+# Returned by _cached_response when there is no usable cached response
+_MISS = object()
 
-logger.info("Configuring Gemini API...")
-try:
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    logger.info("Gemini API configured successfully")
-except Exception as e:
-    logger.error(f"Error configuring Gemini API: {str(e)}")
-    raise
+def _cached_response(key: str, parse: Optional[Callable[[str], Any]]) -> Any:
+    """
+    Look up and parse a cached response, or return _MISS.
+    
+    A cached response that no longer passes parse, e.g. one stored before the
+    parser validated its shape, counts as a miss, and the fresh response replaces it.
+    """
+    text = _RESPONSE_CACHE.get(key)
+    if text is None:
+        return _MISS
+    if parse is None:
+        logger.debug("LLM response cache hit")
+        return text
+    try:
+        result = parse(text)
+    except ValueError as e:
+        logger.warning("Discarding cached LLM response that no longer parses: %s", e)
+        return _MISS
+    logger.debug("LLM response cache hit")
+    return result
+
+def cached_generate(prompt: str, parse: Optional[Callable[[str], Any]] = None) -> Any:
+    """
+    Generate a response for the prompt, reusing the cached response for an identical prompt.
+    
+    Args:
+        prompt (str): Prompt to send
+        parse (Optional[Callable[[str], Any]]): Parser applied to the response text. A
+            response is only cached if it parses, so malformed output is retried next time.
+        
+    Returns:
+        Any: Response text, or the parsed response if parse is given
+    """
+    key = prompt_cache_key(prompt)
+    result = _cached_response(key, parse)
+    if result is not _MISS:
+        return result
+    
+    _RATE_LIMITER.wait()
+    return _parse_and_store(key, get_model().generate_content(prompt).text, parse)
+
+async def cached_generate_async(prompt: str, parse: Optional[Callable[[str], Any]] = None) -> Any:
+    """
+    Async variant of cached_generate, retrying rate-limited calls.
+    
+    Args:
+        prompt (str): Prompt to send
+        parse (Optional[Callable[[str], Any]]): Parser applied to the response text
+        
+    Returns:
+        Any: Response text, or the parsed response if parse is given
+    """
+    key = prompt_cache_key(prompt)
+    result = _cached_response(key, parse)
+    if result is not _MISS:
+        return result
+    
+    response = await generate_content_async(prompt)
+    return _parse_and_store(key, response.text, parse)
+
+async def gather_bounded(coro_func, items: List[Any], limit: int = LLM_MAX_CONCURRENCY) -> List[Any]:
+    """
+    Run coro_func over items concurrently, with at most limit calls in flight.
+    
+    Args:
+        coro_func: Coroutine function taking a single item
+        items (List[Any]): Items to process
+        limit (int): Maximum number of concurrent calls
+        
+    Returns:
+        List[Any]: Results in the order of items
+    """
+    semaphore = asyncio.Semaphore(limit)
+    
+    async def run(item):
+        async with semaphore:
+            return await coro_func(item)
+    
+    return await asyncio.gather(*[run(item) for item in items])
+
+# Markdown code fences around a response
+_CODE_FENCE_RE = re.compile(r'```(?:json)?')
+
+# Trailing commas before a closing bracket or brace
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+
+# Control characters to drop from responses, keeping newlines and tabs
+_CONTROL_CHARS_TABLE = dict.fromkeys(
+    c for c in (*range(32), *range(127, 160)) if chr(c) not in '\n\r\t'
+)
+
+# HTML tags and whitespace runs, stripped from email content before classification
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+
+# Senders that only ever send newsletters: bulk newsletter platforms and
+# newsletter-style mailbox names, matched in a single scan of the sender
+_NEWSLETTER_SENDER_RE = re.compile(
+    r'[@.](?:substack\.com|beehiiv\.com|mailchimp\.com|mcsv\.net|convertkit\.com|'
+    r'ck\.page|buttondown\.email|ghost\.io|revue\.email)\b'
+    r'|\b(?:newsletters?|digest|weekly)@',
+    re.IGNORECASE
+)
+
+def cheap_classify(email: Dict[str, Any]) -> Optional[bool]:
+    """
+    Classify an email from its sender alone, when that is unambiguous.
+    
+    List headers are not conclusive either way: promotions carry them too, and
+    newsletters from individuals or small lists often lack them. They are passed
+    to the LLM as a hint instead, see classify_email_batch_async.
+    
+    Args:
+        email (Dict[str, Any]): Email dictionary with a from field
+        
+    Returns:
+        Optional[bool]: True for known newsletter senders, None if the LLM has to decide
+    """
+    if _NEWSLETTER_SENDER_RE.search(email.get('from', '')):
+        return True
+    return None
+
+def trim_content(content: str, head: int = 200, tail: int = 100) -> str:
+    """
+    Shorten email content for a prompt, keeping its start and its end.
+    
+    The footer of an email (unsubscribe links, sender details) is often what
+    marks it as a newsletter, so it is kept alongside the opening text.
+    
+    Args:
+        content (str): Email content
+        head (int): Number of characters kept from the start
+        tail (int): Number of characters kept from the end
+        
+    Returns:
+        str: Content with tags removed and whitespace collapsed, trimmed to about head + tail characters
+    """
+    content = _WS_RE.sub(' ', _TAG_RE.sub(' ', content)).strip()
+    if len(content) <= head + tail:
+        return content
+    return f"{content[:head]} ... {content[-tail:]}"
 
 def clean_json_response(text: str) -> str:
     """
@@ -42,30 +354,80 @@ def clean_json_response(text: str) -> str:
     Returns:
         str: Cleaned JSON string
     """
-    # Log the raw response for debugging
-    #logger.debug(f"Raw response: {text}")
-    
     # Remove markdown code block markers if present
-    text = text.replace('```json', '').replace('```', '')
+    text = _CODE_FENCE_RE.sub('', text)
     
     # Remove any leading/trailing whitespace and newlines
     text = text.strip()
     
-    # Remove any hidden characters
-    text = ''.join(char for char in text if char.isprintable() or char in '\n\r\t')
+    # Remove control characters other than newlines and tabs
+    text = text.translate(_CONTROL_CHARS_TABLE)
     
     # Remove any trailing commas before closing brackets/braces
-    text = re.sub(r',(\s*[}\]])', r'\1', text)
-    
-    # Log the cleaned response for debugging
-    #logger.debug(f"Cleaned response: {text}")
+    text = _TRAILING_COMMA_RE.sub(r'\1', text)
     
     return text
 
+def parse_json_response(text: str) -> Any:
+    """
+    Parse an LLM response as JSON, cleaning it first only if it does not parse as is.
+    
+    Args:
+        text (str): Raw response text from LLM
+        
+    Returns:
+        Any: Parsed JSON value
+    """
+    # Most responses follow the raw JSON instruction, so skip the cleanup for them
+    if text.lstrip().startswith(('{', '[')):
+        try:
+            return json_loads(text)
+        except json.JSONDecodeError:
+            pass
+    return json_loads(clean_json_response(text))
+
+def parse_id_list_response(text: str, field: str, field_type: type) -> List[Dict[str, Any]]:
+    """
+    Parse and validate an LLM response listing one result per input id.
+    
+    Validation happens here, inside cached_generate_async's parse step, so a
+    response of the wrong shape raises before it is cached and the next run asks again.
+    
+    Args:
+        text (str): Raw response text from LLM
+        field (str): Result field every entry must have
+        field_type (type): Type the field must have
+        
+    Returns:
+        List[Dict[str, Any]]: Entries with an integer id and the field
+        
+    Raises:
+        ValueError: If the response is not a JSON array of such entries
+    """
+    results = parse_json_response(text)
+    if not isinstance(results, list) or not all(
+        isinstance(result, dict)
+        and isinstance(result.get('id'), int) and not isinstance(result['id'], bool)
+        and isinstance(result.get(field), field_type)
+        for result in results
+    ):
+        raise ValueError(f"Expected a JSON array of objects with id and {field}")
+    return results
+
+def parse_verdicts_response(text: str) -> List[Dict[str, Any]]:
+    """Parse and validate the LLM response to a newsletter classification prompt."""
+    return parse_id_list_response(text, 'is_newsletter', bool)
+
+def parse_summaries_response(text: str) -> List[Dict[str, Any]]:
+    """Parse and validate the LLM response to a batch summary prompt."""
+    return parse_id_list_response(text, 'summary', str)
+
 def identify_newsletters(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Use LLM to identify which emails are newsletters.
     
+    Synchronous wrapper around aidentify_newsletters.
+    
     Args:
         emails (List[Dict[str, Any]]): List of email dictionaries to analyze
         
@@ -73,159 +435,553 @@ def identify_newsletters(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         List[Dict[str, Any]]: List of emails with added is_newsletter flag
     """
     try:
-        # Create a safe version of emails for the prompt
-        safe_emails = []
-        for email in emails:
-            safe_email = {
-                'subject': email.get('subject', ''),
-                'from': email.get('from', ''),
-                'content': email.get('content', '')[:1000]  # Limit content length
-            }
-            safe_emails.append(safe_email)
-        
-        prompt = f"""
-        Analyze these emails and identify which ones are newsletters.
-        A newsletter is a regularly distributed publication about a particular topic or set of topics.
-        
-        Emails to analyze:
-        {json.dumps(safe_emails, indent=2)}
-        
-        For each email, determine if it's a newsletter based on the following characteristics:
-        1. Regular distribution pattern
-        2. Topic-focused content
-        3. Mass distribution characteristics
-        4. Newsletter-like formatting
-        5. The email is from a newsletter service provider which is either an individual or an organization
-        6. Emails promoting products or services are not newsletters, job alerts are not newsletters
-        
-        Return a JSON array where each object has:
-        {{
-            "subject": "email subject",
-            "from": "sender email",
-            "is_newsletter": true/false
-        }}
-        
-        IMPORTANT:
-        1. Return ONLY the JSON array, no other text
-        2. Include ALL emails from the input, not just newsletters
-        3. Set is_newsletter to false for non-newsletter emails
-        4. Match the subject and from fields exactly with the input emails
-        5. Respond with raw JSON only, no markdown or code blocks
-        6. DO NOT wrap the response in ```json or any other markdown formatting
-        7. Start your response with a single [ character and end with a single ] character
-        """
-        
-        logger.info("Sending prompt to LLM for newsletter identification")
-        response = model.generate_content(prompt)
-        #logger.debug(f"Response attributes: {dir(response)}")
-        
-        if not hasattr(response, 'text'):
-            logger.error("Response object does not have 'text' attribute")
-            logger.error(f"Available attributes: {dir(response)}")
-            return []
-            
-        logger.debug(f"LLM Response for newsletter identification: {response.text}")
-        
-        # Clean and parse the response as JSON
-        cleaned_response = clean_json_response(response.text)
-        newsletters = json.loads(cleaned_response)
-        
-        # Validate and filter newsletters to match input emails
-        valid_newsletters = []
-        for email in emails:
-            matching_newsletter = next(
-                (n for n in newsletters 
-                 if n['subject'] == email['subject'] and n['from'] == email['from']),
-                None
-            )
-            if matching_newsletter:
-                # Add is_newsletter flag to original email
-                email['is_newsletter'] = matching_newsletter['is_newsletter']
-                valid_newsletters.append(email)
-            else:
-                # If no match found, mark as not a newsletter
-                email['is_newsletter'] = False
-                valid_newsletters.append(email)
-        
-        newsletter_count = sum(1 for email in valid_newsletters if email['is_newsletter'])
-        logger.info(f"Successfully identified {newsletter_count} newsletters out of {len(emails)} emails")
-        
-        return valid_newsletters
+        return asyncio.run(aidentify_newsletters(emails))
     except json.JSONDecodeError as e:
-        logger.error(f"Error parsing JSON response: {str(e)}")
-        logger.error(f"Raw response: {response.text}")
+        logger.error("Error parsing JSON response: %s", e)
         return []
     except Exception as e:
-        logger.error(f"Error identifying newsletters: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error details: {str(e)}")
+        logger.error("Error identifying newsletters: %s", e)
+        logger.error("Error type: %s", type(e).__name__)
+        logger.error("Error details: %s", e)
         return []
 
-def generate_summaries(newsletters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+async def aidentify_newsletters(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Use LLM to generate summaries of the newsletters.
-    """
-    logger.info(f"Starting summary generation for {len(newsletters)} newsletters")
-    summarized_newsletters = []
+    Use LLM to identify which emails are newsletters.
+    
+    Emails from known newsletter senders are classified without an LLM call,
+    and verdicts are cached per email. The rest are classified in chunks of
+    NEWSLETTER_BATCH_SIZE, one LLM call per chunk, with the chunks sent concurrently.
     
-    for i, newsletter in enumerate(newsletters, 1):
-        logger.info(f"Generating summary for newsletter {i}/{len(newsletters)}: {newsletter['subject']}")
+    Args:
+        emails (List[Dict[str, Any]]): List of email dictionaries to analyze
         
-        prompt = f"""
-        Generate a concise summary of this newsletter:
+    Returns:
+        List[Dict[str, Any]]: List of emails with added is_newsletter flag
+    """
+    # Emails decided by sender or with a cached verdict skip the LLM
+    undecided = []
+    keys = []
+    newsletter_count = 0
+    for email in emails:
+        verdict = cheap_classify(email)
+        if verdict is None:
+            undecided.append(email)
+            keys.append(email_cache_key(email))
+        else:
+            email['is_newsletter'] = verdict
+            newsletter_count += verdict
+    
+    # One cache query for all remaining emails
+    cached = VERDICT_CACHE.get_many(keys)
+    if cached:
+        pending = []
+        for email, key in zip(undecided, keys):
+            if key in cached:
+                email['is_newsletter'] = cached[key]
+                newsletter_count += cached[key]
+            else:
+                pending.append((email, key))
+        undecided = [email for email, _ in pending]
+        keys = [key for _, key in pending]
+    logger.info("Classified %s emails by sender or cache, sending %s to the LLM", len(emails) - len(undecided), len(undecided))
+    
+    # Identical emails (e.g. the same issue from two lists) are classified once
+    unique = {}
+    for email, key in zip(undecided, keys):
+        unique.setdefault(key, email)
+    unique_emails = list(unique.values())
+    unique_keys = list(unique)
+    
+    chunks = [
+        (unique_emails[start:start + NEWSLETTER_BATCH_SIZE], start)
+        for start in range(0, len(unique_emails), NEWSLETTER_BATCH_SIZE)
+    ]
+    
+    async def classify_chunk(chunk):
+        # A failed chunk leaves its emails unclassified instead of failing the whole run
+        try:
+            return await classify_email_batch_async(*chunk)
+        except (ValueError, google_exceptions.GoogleAPIError) as e:
+            logger.error("Error classifying %s emails, leaving them unclassified: %s", len(chunk[0]), e)
+            return {}
+    
+    results = await gather_bounded(classify_chunk, chunks)
+    
+    verdicts = {}
+    for chunk_verdicts in results:
+        verdicts.update(chunk_verdicts)
+    
+    # Emails the LLM did not return a verdict for are not newsletters, but are
+    # left uncached so the next run asks again
+    verdicts_by_key = {unique_keys[idx]: verdict for idx, verdict in verdicts.items()}
+    for email, key in zip(undecided, keys):
+        email['is_newsletter'] = verdicts_by_key.get(key, False)
+        newsletter_count += email['is_newsletter']
+    VERDICT_CACHE.set_many(verdicts_by_key.items())
+    
+    logger.info("Successfully identified %s newsletters out of %s emails", newsletter_count, len(emails))
+    
+    return emails
+
+NEWSLETTER_PROMPT = """Analyze these emails and identify which ones are newsletters.
+A newsletter is a regularly distributed publication about a particular topic or set of topics.
+
+For each email, determine if it's a newsletter based on the following characteristics:
+1. Regular distribution pattern
+2. Topic-focused content
+3. Mass distribution characteristics
+4. Newsletter-like formatting
+5. The email is from a newsletter service provider which is either an individual or an organization
+6. Emails promoting products or services are not newsletters, job alerts are not newsletters
+
+Emails fetched with their headers have a list_headers field, true if they carry
+mailing list headers (List-Unsubscribe, List-Id or bulk Precedence). Treat it as
+a hint only: promotions carry these headers too, and newsletters from individuals
+or small lists may not.
+
+Return a JSON array where each object has:
+{
+    "id": id of the email from the input,
+    "is_newsletter": true/false
+}
+
+IMPORTANT:
+1. Return ONLY the JSON array, no other text
+2. Include ALL emails from the input, not just newsletters
+3. Set is_newsletter to false for non-newsletter emails
+4. Use the id field exactly as given in the input emails
+5. Respond with raw JSON only, no markdown or code blocks
+6. DO NOT wrap the response in ```json or any other markdown formatting
+7. Start your response with a single [ character and end with a single ] character
+
+Emails to analyze:
+"""
+
+async def classify_email_batch_async(emails: List[Dict[str, Any]], offset: int) -> Dict[int, bool]:
+    """
+    Use a single LLM call to classify a chunk of emails as newsletters or not.
+    
+    Args:
+        emails (List[Dict[str, Any]]): Chunk of email dictionaries to analyze
+        offset (int): Index of the first email of the chunk in the full list
         
-        Subject: {newsletter['subject']}
-        From: {newsletter['from']}
-        Content: {newsletter['content']}
+    Returns:
+        Dict[int, bool]: is_newsletter verdict keyed by email index in the full list
+    """
+    # Create a safe version of emails for the prompt
+    safe_emails = []
+    for idx, email in enumerate(emails, offset):
+        safe_email = {
+            'id': idx,
+            'subject': email.get('subject', ''),
+            'from': email.get('from', ''),
+            'content': trim_content(email.get('content', ''))
+        }
+        if 'bulk' in email:
+            safe_email['list_headers'] = email['bulk']
+        safe_emails.append(safe_email)
+    
+    # Static instructions first and emails last, so repeated calls share a
+    # common prefix that Gemini can serve from its implicit cache
+    prompt = NEWSLETTER_PROMPT + json_dumps(safe_emails)
+    
+    logger.info("Sending prompt to LLM for newsletter identification of %s emails", len(emails))
+    verdicts = await cached_generate_async(prompt, parse=parse_verdicts_response)
+    logger.debug("LLM Response for newsletter identification: %s", verdicts)
+    
+    # Only integer ids of this chunk with a verdict are used; a float id such as
+    # 3.0 would pass the range check but cannot index the emails
+    return {
+        verdict['id']: bool(verdict['is_newsletter'])
+        for verdict in verdicts
+        if isinstance(verdict, dict) and isinstance(verdict.get('id'), int) and 'is_newsletter' in verdict
+        and verdict['id'] in range(offset, offset + len(emails))
+    }
+
+SUMMARY_PROMPT = """Generate a concise summary of the newsletter below.
+
+Focus on:
+1. Main topics or themes
+2. Key points or highlights
+3. Any calls to action
+
+Keep the summary concise and to the point and do not exceed 200 words.
+
+Return the summary in a clear, structured format.
+
+"""
+
+def email_prompt_fields(email: Dict[str, Any]) -> str:
+    """Format the subject, sender and trimmed content of an email for the end of a prompt."""
+    content = trim_content(email.get('content', ''), head=SUMMARY_CONTENT_HEAD, tail=SUMMARY_CONTENT_TAIL)
+    return f"Subject: {email.get('subject', '')}\nFrom: {email.get('from', '')}\nContent: {content}\n"
+
+def summary_prompt(newsletter: Dict[str, Any]) -> str:
+    """
+    Build the LLM prompt that summarizes a single newsletter.
+    
+    Args:
+        newsletter (Dict[str, Any]): Newsletter dictionary with subject, from and content
         
-        Focus on:
-        1. Main topics or themes
-        2. Key points or highlights
-        3. Any calls to action
+    Returns:
+        str: Summary prompt
+    """
+    return SUMMARY_PROMPT + email_prompt_fields(newsletter)
+
+BATCH_SUMMARY_PROMPT = """Generate a concise summary of each newsletter below.
+
+Each summary should focus on:
+1. Main topics or themes
+2. Key points or highlights
+3. Any calls to action
+
+Keep each summary concise and to the point and do not exceed 200 words per newsletter.
+
+Return a JSON array where each object has:
+{
+    "id": id of the newsletter from the input,
+    "summary": "summary text"
+}
 
-        Keep the summary concise and to the point and do not exceed 200 words.
+IMPORTANT:
+1. Return ONLY the JSON array, no other text
+2. Include one object for EVERY newsletter in the input
+3. Use the id field exactly as given in the input newsletters
+4. Respond with raw JSON only, no markdown or code blocks
+5. DO NOT wrap the response in ```json or any other markdown formatting
+
+Newsletters to summarize:
+"""
+
+async def summarize_batch_async(newsletters: List[Dict[str, Any]], offset: int) -> Dict[int, str]:
+    """
+    Use a single LLM call to summarize a chunk of newsletters.
+    
+    Args:
+        newsletters (List[Dict[str, Any]]): Chunk of newsletters to summarize
+        offset (int): Index of the first newsletter of the chunk in the full list
         
-        Return the summary in a clear, structured format.
-        """
+    Returns:
+        Dict[int, str]: Summary keyed by newsletter index in the full list; empty if
+            the response could not be parsed
+    """
+    safe_newsletters = [
+        {
+            'id': idx,
+            'subject': newsletter.get('subject', ''),
+            'from': newsletter.get('from', ''),
+            'content': trim_content(
+                newsletter.get('content', ''), head=SUMMARY_CONTENT_HEAD, tail=SUMMARY_CONTENT_TAIL
+            )
+        }
+        for idx, newsletter in enumerate(newsletters, offset)
+    ]
+    prompt = BATCH_SUMMARY_PROMPT + json_dumps(safe_newsletters)
+    
+    logger.info("Sending prompt to LLM for summaries of %s newsletters", len(newsletters))
+    try:
+        results = await cached_generate_async(prompt, parse=parse_summaries_response)
+    except ValueError as e:
+        logger.error("Error parsing batch summary response: %s", e)
+        return {}
+    
+    return {
+        result['id']: result['summary']
+        for result in results
+        if result['id'] in range(offset, offset + len(newsletters)) and result['summary'].strip()
+    }
+
+def generate_summaries(newsletters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Use LLM to generate summaries of the newsletters.
+    
+    Synchronous wrapper around agenerate_summaries.
+    """
+    return asyncio.run(agenerate_summaries(newsletters))
+
+async def agenerate_summaries(newsletters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Use LLM to generate summaries of the newsletters, with concurrent calls.
+    
+    Newsletters are summarized in chunks of SUMMARY_BATCH_SIZE, one LLM call per
+    chunk. Newsletters missing from a chunk's response are summarized one call
+    each. At most LLM_MAX_CONCURRENCY calls are in flight at a time.
+    
+    Args:
+        newsletters (List[Dict[str, Any]]): Newsletters to summarize
         
-        logger.debug(f"Making LLM call for summary generation of: {newsletter['subject']}")
-        response = model.generate_content(prompt)
-        logger.debug(f"LLM Response for summary: {response.text}")
+    Returns:
+        List[Dict[str, Any]]: The same newsletters with added summary field
+    """
+    logger.info("Starting summary generation for %s newsletters", len(newsletters))
+    
+    async def summarize_one(newsletter):
+        logger.debug("Making LLM call for summary generation of: %s", newsletter['subject'])
+        summary = await cached_generate_async(summary_prompt(newsletter))
+        logger.debug("LLM Response for summary: %s", summary)
         
-        newsletter['summary'] = response.text
-        summarized_newsletters.append(newsletter)
-        logger.info(f"Completed summary for: {newsletter['subject']}")
+        newsletter['summary'] = summary
+        logger.info("Completed summary for: %s", newsletter['subject'])
+        return newsletter
+    
+    chunks = [
+        (newsletters[start:start + SUMMARY_BATCH_SIZE], start)
+        for start in range(0, len(newsletters), SUMMARY_BATCH_SIZE)
+    ]
+    results = await gather_bounded(lambda chunk: summarize_batch_async(*chunk), chunks)
+    
+    summaries = {}
+    for chunk_summaries in results:
+        summaries.update(chunk_summaries)
+    
+    missing = []
+    for idx, newsletter in enumerate(newsletters):
+        if idx in summaries:
+            newsletter['summary'] = summaries[idx]
+        else:
+            missing.append(newsletter)
+    if missing:
+        logger.info("Falling back to single summaries for %s newsletters", len(missing))
+        await gather_bounded(summarize_one, missing)
+    
+    return newsletters
+
+DIGEST_PROMPT = """Create a well-formatted markdown digest of the newsletter summaries below.
+
+Format it as:
+# Newsletter Digest
+
+## [Newsletter Name/Subject]
+[Summary content]
+
+Include a brief introduction and conclusion.
+
+Newsletter summaries:
+"""
+
+def digest_prompt(summarized_newsletters: List[Dict[str, Any]]) -> str:
+    """
+    Build the LLM prompt for the markdown digest.
+    
+    Only the subject, sender and summary of each newsletter are sent; the
+    digest is written from the summaries, so the full content would only add tokens.
     
-    return summarized_newsletters
+    Args:
+        summarized_newsletters (List[Dict[str, Any]]): Newsletters with summaries
+        
+    Returns:
+        str: Digest prompt
+    """
+    return DIGEST_PROMPT + json_dumps([
+        {
+            'subject': newsletter.get('subject', ''),
+            'from': newsletter.get('from', ''),
+            'summary': newsletter.get('summary', '')
+        }
+        for newsletter in summarized_newsletters
+    ])
 
 def create_markdown_digest(summarized_newsletters: List[Dict[str, Any]]) -> str:
     """
     Create a markdown-formatted digest of the newsletter summaries.
+    
+    Synchronous wrapper around acreate_markdown_digest.
+    """
+    return asyncio.run(acreate_markdown_digest(summarized_newsletters))
+
+async def acreate_markdown_digest(summarized_newsletters: List[Dict[str, Any]]) -> str:
+    """
+    Create a markdown-formatted digest of the newsletter summaries.
+    
+    Args:
+        summarized_newsletters (List[Dict[str, Any]]): Newsletters with summaries
+        
+    Returns:
+        str: Markdown digest
     """
     logger.info("Starting markdown digest creation")
     
-    prompt = f"""
-    Create a well-formatted markdown digest of these newsletter summaries:
+    prompt = digest_prompt(summarized_newsletters)
     
-    {summarized_newsletters}
+    logger.debug("Making LLM call for markdown digest creation")
+    digest = await cached_generate_async(prompt)
+    logger.debug("LLM Response for markdown digest: %s", digest)
     
-    Format it as:
-    # Newsletter Digest
+    logger.info("Successfully created markdown digest")
+    return digest
+
+PLANNER_PROMPT_HEAD = """You are a planning agent for a Gmail newsletter digest generator. Your goal is to process emails and create a single digest with summaries of identified newsletters.
+
+Available tools:
+"""
+
+PLANNER_PROMPT_TAIL = """
+
+For each tool, consider:
+1. Input parameters required and their types
+2. Output parameters and their structure
+3. State requirements (what state it reads and writes)
+
+Return a JSON object with:
+{
+    "tool": "name of the tool to use",
+    "reason": "explanation of why this tool was chosen",
+    "is_complete": true or false # Set to true only after format_digest has been executed and state contains digest, else set to false
+}
+
+Rules for planning:
+1. Only choose a tool if its required input parameters are available in the current state
+2. Consider the state dependencies (what state each tool reads and writes)
+3. The pipeline is complete ONLY when all the following conditions are met:
+   - We have fetched emails
+   - We have identified newsletters
+   - We have generated summaries for newsletters
+   - We have formatted the final digest
+4. Tools must be used in a logical order based on their dependencies
+5. NEVER mark the task as complete until the format_digest tool has been called and the digest is in the state
+
+ALWAYS REMEMBER:
+1. Return ONLY the JSON object, no other text
+2. Respond with raw JSON only, no markdown or code blocks
+3. DO NOT wrap the response in ```json or any other markdown formatting
+4. Set is_complete to true ONLY after format_digest has been called and the digest is in the state
+
+Current state, between <STATE> tags. List slots show how many items they hold:
+"""
+
+def stream_markdown_digest(summarized_newsletters: List[Dict[str, Any]]) -> Iterator[str]:
+    """
+    Create the markdown digest like create_markdown_digest, yielding text as it is generated.
     
-    ## [Newsletter Name/Subject]
-    [Summary content]
+    A cached digest for the same prompt is yielded whole. A freshly streamed
+    digest is cached once the stream completes.
     
-    Include a brief introduction and conclusion.
+    Args:
+        summarized_newsletters (List[Dict[str, Any]]): Newsletters with summaries
+        
+    Yields:
+        str: Consecutive pieces of the markdown digest
     """
+    logger.info("Starting streamed markdown digest creation")
     
-    logger.debug("Making LLM call for markdown digest creation")
-    response = model.generate_content(prompt)
-    logger.debug(f"LLM Response for markdown digest: {response.text}")
+    prompt = digest_prompt(summarized_newsletters)
+    key = prompt_cache_key(prompt)
+    digest = _RESPONSE_CACHE.get(key)
+    if digest is not None:
+        logger.debug("LLM response cache hit")
+        yield digest
+        return
     
-    logger.info("Successfully created markdown digest")
-    return response.text
+    parts = []
+    _RATE_LIMITER.wait()
+    for chunk in get_model().generate_content(prompt, stream=True):
+        parts.append(chunk.text)
+        yield chunk.text
+    
+    _RESPONSE_CACHE.set(key, ''.join(parts))
+    logger.info("Successfully streamed markdown digest")
 
-def plan_next_step(current_state: Dict[str, Any], available_tools: Dict[str, Any]) -> Dict[str, Any]:
+@lru_cache(maxsize=8)
+def planner_prompt_prefix(tools_json: str) -> str:
+    """
+    Build the part of the planner prompt that does not depend on the pipeline state.
+    
+    Keeping this prefix byte-identical across calls lets Gemini reuse its cached
+    prefill for the instructions and tool descriptions.
+    
+    Args:
+        tools_json (str): Serialized tool descriptions
+        
+    Returns:
+        str: Planner instructions, ending just before the current state
+    """
+    return PLANNER_PROMPT_HEAD + tools_json + PLANNER_PROMPT_TAIL
+
+def deterministic_plan(current_state: Dict[str, Any], available_tools: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Pick the next step from the tool manifests, without the LLM.
+    
+    A tool is eligible when every state slot it reads is populated and some slot
+    it writes is still empty. The eligible tool that fills the most empty slots
+    wins, ties going to manifest order, so classify_and_summarize is preferred
+    over analyze_newsletters.
+    
+    Args:
+        current_state (Dict[str, Any]): Current state of the pipeline
+        available_tools (Dict[str, Any]): Dictionary of available tools
+        
+    Returns:
+        Optional[Dict[str, Any]]: Next step, or None if no tool is eligible and the LLM has to decide
+    """
+    if current_state.get('digest'):
+        return {'tool': None, 'reason': 'The digest has been created', 'is_complete': True}
+    
+    best_tool, best_missing = None, []
+    for tool_name, manifest in TOOL_MANIFESTS.items():
+        if tool_name not in available_tools:
+            continue
+        requirements = manifest['state_requirements']
+        if not all(current_state.get(key) for key in requirements['reads']):
+            continue
+        missing = [key for key in requirements['writes'] if not current_state.get(key)]
+        if len(missing) > len(best_missing):
+            best_tool, best_missing = tool_name, missing
+    
+    if best_tool is None:
+        return None
+    return {'tool': best_tool, 'reason': f"State has no {', '.join(best_missing)} yet", 'is_complete': False}
+
+# Required plan fields and the types the planner must return for them
+_PLAN_FIELD_TYPES = {
+    'tool': (str, type(None)),
+    'reason': str,
+    'is_complete': bool,
+}
+
+def parse_plan_response(text: str) -> Dict[str, Any]:
+    """
+    Parse and validate the LLM response to a planner prompt.
+    
+    Args:
+        text (str): Raw response text from LLM
+        
+    Returns:
+        Dict[str, Any]: Plan with tool, reason and is_complete
+        
+    Raises:
+        ValueError: If the response is not a JSON object with correctly typed plan fields
+    """
+    plan = parse_json_response(text)
+    if not isinstance(plan, dict) or not all(
+        field in plan and isinstance(plan[field], types) for field, types in _PLAN_FIELD_TYPES.items()
+    ):
+        raise ValueError("Invalid plan format")
+    return plan
+
+def compact_state(current_state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Describe the state for the planner prompt by how full each slot is, not by its contents.
+    
+    Args:
+        current_state (Dict[str, Any]): Current state of the pipeline
+        
+    Returns:
+        Dict[str, Any]: Item counts for list slots, lengths for long strings such as
+            the digest, and other values unchanged
+    """
+    compact = {}
+    for key, value in current_state.items():
+        if isinstance(value, list):
+            compact[key] = {'count': len(value)}
+        elif isinstance(value, str) and len(value) > 100:
+            compact[key] = {'length': len(value)}
+        else:
+            compact[key] = value
+    return compact
+
+def plan_next_step(current_state: Dict[str, Any], available_tools: Dict[str, Any],
+                   tools_json: Optional[str] = None) -> Dict[str, Any]:
     """
     Use LLM to plan the next step in the email processing pipeline.
     
@@ -237,6 +993,7 @@ def plan_next_step(current_state: Dict[str, Any], available_tools: Dict[str, Any
             - digest: Current digest if any
         available_tools (Dict[str, Any]): Dictionary of available tools with their descriptions,
             input parameters, output parameters, and state requirements
+        tools_json (Optional[str]): Pre-serialized available_tools, to avoid re-encoding them on every call
         
     Returns:
         Dict[str, Any]: Next step to take, including:
@@ -246,71 +1003,41 @@ def plan_next_step(current_state: Dict[str, Any], available_tools: Dict[str, Any
     """
     logger.info("Planning next step in the pipeline")
     
-    # Create a more detailed prompt that includes tool requirements
-    prompt = f"""
-    You are a planning agent for a Gmail newsletter digest generator. Your goal is to process emails and create a single digest with summaries of identified newsletters.
-    
-    Current state:
-    {json.dumps(current_state, indent=2)}
-    
-    Available tools:
-    {json.dumps(available_tools, indent=2)}
-    
-    For each tool, consider:
-    1. Input parameters required and their types
-    2. Output parameters and their structure
-    3. State requirements (what state it reads and writes)
-
-    Return a JSON object with:
-    {{
-        "tool": "name of the tool to use",
-        "reason": "explanation of why this tool was chosen",
-        "is_complete": true or false # Set to true only after format_digest has been executed and state contains digest, else set to false
-    }}
-    
-    Rules for planning:
-    1. Only choose a tool if its required input parameters are available in the current state
-    2. Consider the state dependencies (what state each tool reads and writes)
-    3. The pipeline is complete ONLY when all the following conditions are met:
-       - We have fetched emails
-       - We have identified newsletters
-       - We have generated summaries for newsletters
-       - We have formatted the final digest
-    4. Tools must be used in a logical order based on their dependencies
-    5. NEVER mark the task as complete until the format_digest tool has been called and the digest is in the state
-    
-    ALWAYS REMEMBER:
-    1. Return ONLY the JSON object, no other text
-    2. Respond with raw JSON only, no markdown or code blocks
-    3. DO NOT wrap the response in ```json or any other markdown formatting
-    4. Set is_complete to true ONLY after format_digest has been called and the digest is in the state
-    """
+    plan = deterministic_plan(current_state, available_tools)
+    if plan is not None:
+        logger.debug("Deterministic plan: %s", plan)
+        return plan
     
-    logger.debug("Making LLM call for next step planning")
-    response = model.generate_content(prompt)
-    logger.debug(f"LLM Response for planning: {response.text}")
+    if tools_json is None:
+        # Reuse the serialization built at import when planning over the full tool set
+        if available_tools is PLANNER_TOOLS:
+            tools_json = TOOL_MANIFESTS_JSON
+        else:
+            tools_json = json.dumps(available_tools, sort_keys=True, separators=(',', ':'))
+    
+    # The state goes last so that the rest of the prompt is an identical prefix on every call
+    # Only slot sizes are sent, the planner does not need the emails themselves
+    prompt = planner_prompt_prefix(tools_json) + '<STATE>' + json_dumps(compact_state(current_state)) + '</STATE>'
     
+    logger.debug("Making LLM call for next step planning")
     try:
-        # Clean and parse the response
-        cleaned_response = clean_json_response(response.text)
-        plan = json.loads(cleaned_response)
+        # Generate, parse and validate the response; invalid plans are not cached
+        plan = cached_generate(prompt, parse=parse_plan_response)
+        logger.debug("LLM Response for planning: %s", plan)
         
-        # Validate the plan
-        if not isinstance(plan, dict) or 'tool' not in plan or 'reason' not in plan or 'is_complete' not in plan:
-            logger.error("Invalid plan format")
-            return {'tool': None, 'reason': 'Invalid plan format', 'is_complete': False}
-            
         # Validate tool selection
         if plan['tool'] and plan['tool'] not in available_tools:
-            logger.error(f"Invalid tool selected: {plan['tool']}")
+            logger.error("Invalid tool selected: %s", plan['tool'])
             return {'tool': None, 'reason': f'Invalid tool selected: {plan["tool"]}', 'is_complete': False}
             
         return plan
         
     except json.JSONDecodeError as e:
-        logger.error(f"Error parsing JSON response: {str(e)}")
-        logger.error(f"Raw response: {response.text}")
+        logger.error("Error parsing JSON response: %s", e)
         return {'tool': None, 'reason': 'Error parsing response', 'is_complete': False}
+    except ValueError as e:
+        logger.error("%s", e)
+        return {'tool': None, 'reason': str(e), 'is_complete': False}
     except Exception as e:
-        logger.error(f"Error in plan_next_step: {str(e)}")
+        logger.error("Error in plan_next_step: %s", e)
         return {'tool': None, 'reason': f'Error: {str(e)}', 'is_complete': False} 
\ No newline at end of file
@@ -0,0 +1,27 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(text: str) -> Any:
+    """
+    Parse JSON text, using orjson when it is installed.
+    
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the same error either way.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def json_dumps(value: Any) -> str:
+    """
+    Serialize a value to compact JSON, using orjson when it is installed.
+    
+    Non-string keys are converted to strings, as the json module does.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
@@ -1,3 +1,4 @@
+import json
 from typing import List, Dict, Any
 
 TOOL_MANIFESTS = {
@@ -14,11 +15,13 @@ TOOL_MANIFESTS = {
         },
         'output_params': {
             'type': 'List[Dict[str, Any]]',
-            'description': 'List of email dictionaries containing subject, sender, and content',
+            'description': 'List of email dictionaries containing message ID, subject, sender, and content',
             'structure': {
+                'id': 'str',
                 'subject': 'str',
                 'from': 'str',
-                'content': 'str'
+                'content': 'str',
+                'bulk': 'bool'
             }
         },
         'state_requirements': {
@@ -82,6 +85,33 @@ TOOL_MANIFESTS = {
             'writes': ['summarized_newsletters']
         }
     },
+    'classify_and_summarize': {
+        'name': 'classify_and_summarize',
+        'description': 'Identifies newsletters among emails and summarizes them in a single step',
+        'input_params': {
+            'emails': {
+                'type': 'List[Dict[str, Any]]',
+                'description': 'List of email dictionaries to classify and summarize',
+                'required': True,
+                'filter': None
+            }
+        },
+        'output_params': {
+            'type': 'List[Dict[str, Any]]',
+            'description': 'List of emails with added is_newsletter flag and, for newsletters, a summary field',
+            'structure': {
+                'subject': 'str',
+                'from': 'str',
+                'content': 'str',
+                'is_newsletter': 'bool',
+                'summary': 'str'
+            }
+        },
+        'state_requirements': {
+            'reads': ['emails'],
+            'writes': ['newsletters', 'summarized_newsletters']
+        }
+    },
     'format_digest': {
         'name': 'format_digest',
         'description': 'Formats newsletter summaries into a markdown digest',
@@ -105,4 +135,17 @@ TOOL_MANIFESTS = {
             'writes': ['digest']
         }
     }
-} 
\ No newline at end of file
+} 
+
+# Planner view of the manifests: what each tool does and the parameters it takes and returns
+PLANNER_TOOLS = {
+    name: {
+        'description': manifest['description'],
+        'input_params': manifest['input_params'],
+        'output_params': manifest['output_params']
+    }
+    for name, manifest in TOOL_MANIFESTS.items()
+}
+
+# Serialized once at import; sorted keys keep the planner prompt prefix byte-identical across processes
+TOOL_MANIFESTS_JSON = json.dumps(PLANNER_TOOLS, sort_keys=True, separators=(',', ':'))
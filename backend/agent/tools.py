@@ -1,28 +1,71 @@
+import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Optional
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from google.auth.transport.requests import AuthorizedSession, Request
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from requests.adapters import HTTPAdapter
+import httplib2
 import pickle
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import base64
 from email.mime.text import MIMEText
-from .llm import identify_newsletters, generate_summaries, create_markdown_digest
+from .llm import (
+    aidentify_newsletters,
+    agenerate_summaries,
+    create_markdown_digest,
+    acreate_markdown_digest
+)
+from .cache import SUMMARY_CACHE, email_cache_key
+from .serialization import json_loads
 
 logger = logging.getLogger(__name__)
 
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
-def get_gmail_service():
+# Calls per Gmail batch request. Gmail accepts up to 100, but rate limits the
+# individual calls of larger batches, so it recommends at most 50
+GMAIL_BATCH_SIZE = 50
+
+# HTTP statuses of batched calls that are worth retrying
+GMAIL_RETRYABLE_STATUSES = (429, 500, 503)
+
+# Set GMAIL_USE_BATCH=false to fetch messages with concurrent single requests instead
+USE_BATCH = os.environ.get('GMAIL_USE_BATCH', 'true').lower() in ('1', 'true', 'yes')
+
+# Upper bound on in-flight single-message requests, to stay within Gmail quota
+GMAIL_MAX_CONCURRENCY = 20
+
+# Headers requested with format='metadata', enough to classify a message without its body
+GMAIL_METADATA_HEADERS = ['Subject', 'From', 'List-Unsubscribe', 'List-Id', 'Precedence']
+
+# Message IDs per messages.list page, two batch requests' worth
+GMAIL_LIST_PAGE_SIZE = 100
+
+# Messages in the first chunk when fetching overlaps with classification, see aiter_email_chunks
+FETCH_CHUNK_SIZE = 10
+
+GMAIL_API_URL = 'https://gmail.googleapis.com/gmail/v1/users/me'
+
+def get_gmail_credentials(force_refresh=False):
     creds = None
     if os.path.exists('token.pickle'):
         with open('token.pickle', 'rb') as token:
             creds = pickle.load(token)
     
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
+    # force_refresh exchanges the refresh token even if the stored token looks
+    # valid, for when Gmail has rejected it
+    if not creds or not creds.valid or force_refresh:
+        if creds and (creds.expired or force_refresh) and creds.refresh_token:
             creds.refresh(Request())
         else:
             current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -38,78 +81,571 @@ def get_gmail_service():
         with open('token.pickle', 'wb') as token:
             pickle.dump(creds, token)
 
-    return build('gmail', 'v1', credentials=creds)
+    return creds
 
-def get_email_content(service, msg_id):
-    try:
-        message = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
-        headers = message['payload']['headers']
-        subject = next(header['value'] for header in headers if header['name'].lower() == 'subject')
-        from_header = next(header['value'] for header in headers if header['name'].lower() == 'from')
-        
-        # Get email body
-        if 'parts' in message['payload']:
-            parts = message['payload']['parts']
-            data = parts[0]['body'].get('data', '')
-        else:
-            data = message['payload']['body'].get('data', '')
-            
+# Credentials are loaded once per process and shared; Gmail services are not
+# thread safe (httplib2), so each thread builds and keeps its own
+_credentials = None
+_credentials_refresh = False
+_credentials_lock = threading.Lock()
+_thread_local = threading.local()
+_service = None
+_service_credentials = None
+_service_lock = threading.Lock()
+_session = None
+_session_credentials = None
+
+def get_cached_credentials():
+    """
+    Return the process-wide Gmail credentials, reloading them only once they are no longer valid.
+    """
+    global _credentials, _credentials_refresh
+    with _credentials_lock:
+        if _credentials is None or not _credentials.valid:
+            _credentials = get_gmail_credentials(force_refresh=_credentials_refresh)
+            _credentials_refresh = False
+        return _credentials
+
+def invalidate_credentials_on_401(error: Exception) -> None:
+    """
+    Drop the cached credentials if Gmail rejected them, so the next call reloads them.
+    
+    The reloaded token is refreshed even if it looks valid, since token.pickle
+    holds the same token Gmail just rejected.
+    
+    Args:
+        error (Exception): Error raised by a Gmail API call (HttpError or requests.HTTPError)
+    """
+    global _credentials, _credentials_refresh
+    status = (getattr(getattr(error, 'resp', None), 'status', None)
+              or getattr(getattr(error, 'response', None), 'status_code', None))
+    if status == 401:
+        logger.warning("Gmail rejected the cached credentials, refreshing them on the next call")
+        with _credentials_lock:
+            _credentials = None
+            _credentials_refresh = True
+
+@lru_cache(maxsize=1)
+def get_gmail_discovery_document():
+    """
+    Return the Gmail discovery document bundled with google-api-python-client, read and parsed once per process.
+    """
+    document = get_static_doc('gmail', 'v1')
+    return json_loads(document) if document is not None else None
+
+def warm_up_gmail() -> None:
+    """
+    Load the Gmail credentials and the discovery document concurrently, ahead of the first request.
+    
+    Refreshing the OAuth token and reading the discovery document are independent,
+    so startup waits for the slower of the two rather than both.
+    """
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(get_cached_credentials), pool.submit(get_gmail_discovery_document)]
+        for future in futures:
+            future.result()
+
+def get_gmail_session():
+    """
+    Return the process-wide session for the Gmail REST API, rebuilt only after the credentials change.
+    
+    Reusing one session keeps connections to Gmail alive between calls, and its
+    connection pool is sized for GMAIL_MAX_CONCURRENCY requests in flight.
+    """
+    global _session, _session_credentials
+    creds = get_cached_credentials()
+    with _credentials_lock:
+        if _session is None or _session_credentials is not creds:
+            if _session is not None:
+                _session.close()
+            _session = AuthorizedSession(creds)
+            _session.mount('https://', HTTPAdapter(pool_maxsize=GMAIL_MAX_CONCURRENCY))
+            _session_credentials = creds
+        return _session
+
+def get_gmail_service():
+    """
+    Return the process-wide Gmail API service, built once and rebuilt only after the credentials change.
+    
+    Requests made through the service must be executed with get_gmail_http(),
+    since the HTTP client the service was built with is not thread safe.
+    """
+    global _service, _service_credentials
+    creds = get_cached_credentials()
+    with _service_lock:
+        if _service is None or _service_credentials is not creds:
+            document = get_gmail_discovery_document()
+            if document is not None:
+                _service = build_from_document(document, credentials=creds)
+            else:
+                _service = build(
+                    'gmail', 'v1', credentials=creds, cache_discovery=False, static_discovery=True
+                )
+            _service_credentials = creds
+        return _service
+
+def get_gmail_http():
+    """
+    Return this thread's authorized HTTP client for executing Gmail API requests.
+    
+    httplib2 connections cannot be shared between threads, so each thread gets
+    its own. Unlike the service, a client is cheap to create.
+    """
+    creds = get_cached_credentials()
+    if getattr(_thread_local, 'credentials', None) is not creds:
+        _thread_local.http = AuthorizedHttp(creds, http=httplib2.Http())
+        _thread_local.credentials = creds
+    return _thread_local.http
+
+# Maps the URL-safe base64 alphabet used by the Gmail API to the standard one
+_URLSAFE_TO_STD = str.maketrans('-_', '+/')
+
+def message_request_params(metadata_only: bool = False) -> Dict[str, Any]:
+    """
+    Query parameters for messages.get, for the full message or only its headers and snippet.
+    
+    Args:
+        metadata_only (bool, optional): Skip the message body. Defaults to False.
+        
+    Returns:
+        Dict[str, Any]: format and, for metadata, the metadataHeaders to return
+    """
+    if metadata_only:
+        return {'format': 'metadata', 'metadataHeaders': GMAIL_METADATA_HEADERS}
+    return {'format': 'full'}
+
+def find_body_data(payload: Dict[str, Any]) -> str:
+    """
+    Find the encoded body of a message payload, preferring the first text/plain part.
+    
+    Multipart payloads are searched depth first. If there is no text/plain part,
+    the first part with any body data (usually text/html) is used instead.
+    
+    Args:
+        payload (Dict[str, Any]): Message payload or one of its parts
+        
+    Returns:
+        str: URL-safe base64 body data, or an empty string if there is none
+    """
+    fallback = ''
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        data = part.get('body', {}).get('data', '')
         if data:
-            text = base64.urlsafe_b64decode(data).decode()
-        else:
-            text = "No content"
-            
-        return {
-            'subject': subject,
-            'from': from_header,
-            'content': text
-        }
+            if part.get('mimeType') == 'text/plain':
+                return data
+            fallback = fallback or data
+        # Reversed so parts are visited in document order
+        stack.extend(reversed(part.get('parts', [])))
+    return fallback
+
+def parse_email_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract subject, sender and body text from a Gmail API message resource.
+    
+    Args:
+        message (Dict[str, Any]): Message returned by messages.get, with format='full' or 'metadata'
+        
+    Returns:
+        Dict[str, Any]: Email dictionary with id, subject, from, content and bulk, which
+            tells whether the message carries mailing list headers. Messages fetched
+            without a body get their snippet as content.
+    """
+    payload = message['payload']
+    headers = {header['name'].lower(): header['value'] for header in payload.get('headers', [])}
+    
+    data = find_body_data(payload)
+    if data:
+        text = base64.b64decode(data.translate(_URLSAFE_TO_STD)).decode('utf-8', 'replace')
+    else:
+        text = message.get('snippet') or "No content"
+        
+    return {
+        'id': message.get('id', ''),
+        'subject': headers.get('subject', ''),
+        'from': headers.get('from', ''),
+        'content': text,
+        'bulk': bool(
+            headers.get('list-unsubscribe') or headers.get('list-id')
+            or headers.get('precedence', '').lower() in ('bulk', 'list')
+        )
+    }
+
+def get_email_content(service, msg_id, metadata_only=False):
+    try:
+        message = service.users().messages().get(
+            userId='me', id=msg_id, **message_request_params(metadata_only)
+        ).execute(http=get_gmail_http())
+        return parse_email_message(message)
     except Exception as e:
-        logger.error(f"Error getting email content for message {msg_id}: {str(e)}")
+        logger.error("Error getting email content for message %s: %s", msg_id, e)
         return {'error': str(e)}
 
-def fetch_emails(num_emails=10) -> List[Dict[str, Any]]:
+def get_email_contents_batch(service, msg_ids: List[str], metadata_only=False) -> List[Dict[str, Any]]:
+    """
+    Fetch several messages using Gmail batch requests.
+    
+    Args:
+        service: Authorized Gmail API service
+        msg_ids (List[str]): IDs of the messages to fetch
+        metadata_only (bool, optional): Fetch only headers and snippets. Defaults to False.
+        
+    Returns:
+        List[Dict[str, Any]]: Parsed emails in the order of msg_ids, skipping failures
+    """
+    results = {}
+    retry_ids = []
+    auth_failures = []
+    
+    params = message_request_params(metadata_only)
+    http = get_gmail_http()
+    
+    def get_message(msg_id):
+        return service.users().messages().get(userId='me', id=msg_id, **params)
+    
+    def collect(request_id, response, exception):
+        if exception is not None:
+            status = getattr(getattr(exception, 'resp', None), 'status', None)
+            if status in GMAIL_RETRYABLE_STATUSES:
+                retry_ids.append(request_id)
+            elif status == 401:
+                auth_failures.append((request_id, exception))
+            else:
+                logger.error("Error getting email content for message %s: %s", request_id, exception)
+            return
+        try:
+            results[request_id] = parse_email_message(response)
+        except Exception as e:
+            logger.error("Error parsing email content for message %s: %s", request_id, e)
+    
+    def execute_batches(ids):
+        for start in range(0, len(ids), GMAIL_BATCH_SIZE):
+            chunk = ids[start:start + GMAIL_BATCH_SIZE]
+            if len(chunk) == 1:
+                # A batch of one call only adds multipart encoding on both ends
+                try:
+                    collect(chunk[0], get_message(chunk[0]).execute(http=http), None)
+                except HttpError as e:
+                    collect(chunk[0], None, e)
+                continue
+            batch = service.new_batch_http_request(callback=collect)
+            for msg_id in chunk:
+                batch.add(get_message(msg_id), request_id=msg_id)
+            batch.execute(http=http)
+    
+    execute_batches(msg_ids)
+    
+    # Calls rejected with 401 get one more try with refreshed credentials
+    if auth_failures:
+        failed = [msg_id for msg_id, _ in auth_failures]
+        invalidate_credentials_on_401(auth_failures[0][1])
+        auth_failures.clear()
+        http = get_gmail_http()
+        execute_batches(failed)
+        for msg_id, exception in auth_failures:
+            logger.error("Error getting email content for message %s: %s", msg_id, exception)
+    
+    # Calls rejected by rate limits or server errors get one more try
+    if retry_ids:
+        failed, retry_ids = retry_ids, []
+        logger.warning("Retrying %s rate-limited or failed messages", len(failed))
+        time.sleep(1)
+        execute_batches(failed)
+        for msg_id in retry_ids:
+            logger.error("Error getting email content for message %s after retry", msg_id)
+    
+    return [results[msg_id] for msg_id in msg_ids if msg_id in results]
+
+def iter_message_id_pages(list_page: Callable[[int, Optional[str]], Dict[str, Any]],
+                          num_emails: int) -> Iterator[List[str]]:
+    """
+    List the IDs of the most recent messages, one messages.list page at a time.
+    
+    Args:
+        list_page (Callable[[int, Optional[str]], Dict[str, Any]]): Calls messages.list
+            with maxResults and pageToken and returns the response
+        num_emails (int): Number of message IDs to list
+        
+    Yields:
+        List[str]: Gmail message IDs of the next page, most recent first
+    """
+    page_token = None
+    remaining = num_emails
+    while remaining > 0:
+        results = list_page(min(remaining, GMAIL_LIST_PAGE_SIZE), page_token)
+        msg_ids = [message['id'] for message in results.get('messages', [])][:remaining]
+        if not msg_ids:
+            return
+        yield msg_ids
+        remaining -= len(msg_ids)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+
+def list_message_id_pages(num_emails=10) -> Iterator[List[str]]:
+    """
+    List the IDs of the most recent messages page by page, with this thread's Gmail service.
+    
+    Args:
+        num_emails (int, optional): Number of message IDs to list. Defaults to 10.
+        
+    Yields:
+        List[str]: Gmail message IDs of the next page, most recent first
+    """
+    messages = get_gmail_service().users().messages()
+    return iter_message_id_pages(
+        lambda max_results, page_token: messages.list(
+            userId='me', maxResults=max_results, pageToken=page_token
+        ).execute(http=get_gmail_http()),
+        num_emails
+    )
+
+def list_message_ids(num_emails=10) -> List[str]:
+    """
+    List the IDs of the most recent messages, without fetching their content.
+    
+    Args:
+        num_emails (int, optional): Number of message IDs to list. Defaults to 10.
+        
+    Returns:
+        List[str]: Gmail message IDs, most recent first
+    """
+    return [msg_id for page in list_message_id_pages(num_emails) for msg_id in page]
+
+def get_gmail_json(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Send a GET request to the Gmail REST API with the process-wide session.
+    
+    Args:
+        path (str): Path below GMAIL_API_URL, e.g. '/messages'
+        params (Dict[str, Any]): Query parameters
+        
+    Returns:
+        Dict[str, Any]: Decoded JSON response
+    """
+    response = get_gmail_session().get(f"{GMAIL_API_URL}{path}", params=params)
+    response.raise_for_status()
+    return response.json()
+
+async def afetch_messages(msg_ids: List[str], metadata_only=False,
+                          semaphore: Optional[asyncio.Semaphore] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch the given messages with concurrent single-message requests to the Gmail REST API.
+    
+    Used when batch requests are disabled or rejected. At most
+    GMAIL_MAX_CONCURRENCY requests are in flight at a time.
+    
+    Args:
+        msg_ids (List[str]): IDs of the messages to fetch
+        metadata_only (bool, optional): Fetch only headers and snippets. Defaults to False.
+        semaphore (Optional[asyncio.Semaphore]): Bound shared with other calls, a new one if None
+        
+    Returns:
+        List[Dict[str, Any]]: Parsed emails in the order of msg_ids, skipping failures
+    """
+    semaphore = semaphore or asyncio.Semaphore(GMAIL_MAX_CONCURRENCY)
+    params = message_request_params(metadata_only)
+    
+    async def fetch_one(msg_id):
+        async with semaphore:
+            try:
+                message = await asyncio.to_thread(get_gmail_json, f"/messages/{msg_id}", params)
+                return parse_email_message(message)
+            except Exception as e:
+                logger.error("Error getting email content for message %s: %s", msg_id, e)
+                return None
+    
+    emails = await asyncio.gather(*[fetch_one(msg_id) for msg_id in msg_ids])
+    return [email for email in emails if email is not None]
+
+async def fetch_emails_async(num_emails=10, metadata_only=False) -> List[Dict[str, Any]]:
+    """
+    Fetch emails with concurrent single-message requests to the Gmail REST API.
+    
+    Args:
+        num_emails (int, optional): Number of emails to fetch. Defaults to 10.
+        metadata_only (bool, optional): Fetch only headers and snippets. Defaults to False.
+        
+    Returns:
+        List[Dict[str, Any]]: Emails in inbox order, skipping messages that failed
+    """
+    semaphore = asyncio.Semaphore(GMAIL_MAX_CONCURRENCY)
+    pages = iter_message_id_pages(
+        lambda max_results, page_token: get_gmail_json(
+            '/messages', {'maxResults': max_results, 'pageToken': page_token}
+        ),
+        num_emails
+    )
+    # Messages of each page are fetched while the next page is listed
+    tasks = []
+    while (msg_ids := await asyncio.to_thread(next, pages, None)) is not None:
+        tasks.append(asyncio.create_task(afetch_messages(msg_ids, metadata_only, semaphore)))
+    pages_emails = await asyncio.gather(*tasks)
+    return [email for emails in pages_emails for email in emails]
+
+def fetch_emails(num_emails=10, metadata_only=False) -> List[Dict[str, Any]]:
     """
     Tool to fetch emails from Gmail using the Gmail API.
     
+    Message bodies are requested in batches of up to GMAIL_BATCH_SIZE per HTTP call.
+    If batching is disabled or the batch endpoint fails, messages are fetched
+    concurrently with fetch_emails_async instead.
+    
+    With metadata_only, only the headers in GMAIL_METADATA_HEADERS and the snippet
+    are transferred, which is enough to classify the emails. fetch_full_emails
+    then fetches the bodies of the ones that need them.
+    
     Args:
         num_emails (int, optional): Number of emails to fetch. Defaults to 10.
+        metadata_only (bool, optional): Fetch only headers and snippets. Defaults to False.
         
     Returns:
         List[Dict[str, Any]]: List of email dictionaries containing:
+            - id (str): Gmail message ID
             - subject (str): Email subject
             - from (str): Sender email
             - content (str): Email content
     """
     try:
-        logger.info(f"Fetching {num_emails} emails from Gmail")
-        service = get_gmail_service()
-        
-        # Get list of emails
-        results = service.users().messages().list(userId='me', maxResults=num_emails).execute()
-        messages = results.get('messages', [])
-        
-        if not messages:
-            logger.info("No messages found")
-            return []
-        
-        emails = []
-        for message in messages:
-            email_data = get_email_content(service, message['id'])
-            if 'error' not in email_data:
-                emails.append(email_data)
+        logger.info("Fetching %s emails from Gmail", num_emails)
+        if not USE_BATCH:
+            emails = asyncio.run(fetch_emails_async(num_emails, metadata_only))
+            logger.info("Successfully retrieved %s emails", len(emails))
+            return emails
+        
+        def fetch_page(msg_ids):
+            return get_email_contents_batch(get_gmail_service(), msg_ids, metadata_only)
+        
+        try:
+            # Each page of message IDs is fetched in a worker while the next page is listed
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                futures = [pool.submit(fetch_page, msg_ids) for msg_ids in list_message_id_pages(num_emails)]
+                emails = [email for future in futures for email in future.result()]
+            if not futures:
+                logger.info("No messages found")
+                return []
+        except HttpError as e:
+            logger.warning("Batch request failed, fetching messages concurrently: %s", e)
+            emails = asyncio.run(fetch_emails_async(num_emails, metadata_only))
             
-        logger.info(f"Successfully retrieved {len(emails)} emails")
+        logger.info("Successfully retrieved %s emails", len(emails))
         return emails
         
     except Exception as e:
-        logger.error(f"Error in fetch_emails: {str(e)}")
+        logger.error("Error in fetch_emails: %s", e)
+        invalidate_credentials_on_401(e)
+        raise
+
+async def afetch_emails(num_emails=10, metadata_only=False) -> List[Dict[str, Any]]:
+    """
+    Async variant of fetch_emails, for callers already running an event loop.
+    
+    The batch client is blocking, so batch fetches run in a worker thread.
+    """
+    if not USE_BATCH:
+        logger.info("Fetching %s emails from Gmail", num_emails)
+        try:
+            emails = await fetch_emails_async(num_emails, metadata_only)
+        except Exception as e:
+            invalidate_credentials_on_401(e)
+            raise
+        logger.info("Successfully retrieved %s emails", len(emails))
+        return emails
+    return await asyncio.to_thread(fetch_emails, num_emails, metadata_only)
+
+def fetch_full_emails(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fetch the full messages for emails fetched with metadata_only.
+    
+    Args:
+        emails (List[Dict[str, Any]]): Emails with their Gmail message id
+        
+    Returns:
+        List[Dict[str, Any]]: The same emails with their body as content, skipping failures.
+            Fields added since the metadata fetch, such as is_newsletter, are kept.
+    """
+    return asyncio.run(afetch_full_emails(emails))
+
+async def afetch_full_emails(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Async variant of fetch_full_emails, for callers already running an event loop.
+    """
+    full = {email['id']: email for email in await aget_email_contents([email['id'] for email in emails])}
+    return [{**email, **full[email['id']]} for email in emails if email['id'] in full]
+
+async def aget_email_contents(msg_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Fetch the given messages, with batch requests where possible.
+    
+    If batching is disabled or the batch endpoint fails, the messages are
+    fetched concurrently with afetch_messages instead.
+    
+    Args:
+        msg_ids (List[str]): IDs of the messages to fetch
+        
+    Returns:
+        List[Dict[str, Any]]: Parsed emails in the order of msg_ids, skipping failures
+    """
+    if USE_BATCH:
+        try:
+            # The batch client is blocking, so it runs in a worker thread
+            return await asyncio.to_thread(
+                lambda: get_email_contents_batch(get_gmail_service(), msg_ids)
+            )
+        except HttpError as e:
+            logger.warning("Batch request failed, fetching messages concurrently: %s", e)
+    return await afetch_messages(msg_ids)
+
+async def aiter_email_chunks(num_emails=10, chunk_size=FETCH_CHUNK_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Fetch emails in chunks, yielding each chunk in inbox order as soon as it has arrived.
+    
+    Lets callers start processing the first emails while later ones are still
+    being fetched. The first chunk holds chunk_size messages so that it arrives
+    quickly; later ones hold up to GMAIL_BATCH_SIZE. All chunks of a page are
+    fetched concurrently, while the next page is listed.
+    
+    Args:
+        num_emails (int, optional): Number of emails to fetch. Defaults to 10.
+        chunk_size (int, optional): Number of messages in the first chunk. Defaults to FETCH_CHUNK_SIZE.
+        
+    Yields:
+        List[Dict[str, Any]]: Emails of the next chunk, in inbox order
+    """
+    logger.info("Fetching %s emails from Gmail in chunks", num_emails)
+    tasks = []
+    try:
+        pages = await asyncio.to_thread(list_message_id_pages, num_emails)
+        next_page = asyncio.create_task(asyncio.to_thread(next, pages, None))
+        tasks.append(next_page)
+        size = chunk_size
+        while (msg_ids := await next_page) is not None:
+            chunks = []
+            start = 0
+            while start < len(msg_ids):
+                chunks.append(asyncio.create_task(aget_email_contents(msg_ids[start:start + size])))
+                start += size
+                size = GMAIL_BATCH_SIZE
+            next_page = asyncio.create_task(asyncio.to_thread(next, pages, None))
+            tasks = chunks + [next_page]
+            for chunk in chunks:
+                yield await chunk
+    except Exception as e:
+        invalidate_credentials_on_401(e)
         raise
+    finally:
+        # Fetches still running when the caller stops early are not needed
+        for task in tasks:
+            task.cancel()
 
 def analyze_newsletters(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Tool to analyze emails and identify which ones are newsletters.
     
+    Verdicts are cached per email by aidentify_newsletters, so only emails not
+    seen before are sent to the LLM.
+    
     Args:
         emails (List[Dict[str, Any]]): List of email dictionaries containing:
             - subject (str): Email subject
@@ -123,13 +659,29 @@ def analyze_newsletters(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             - content (str): Email content
             - is_newsletter (bool): Whether the email is identified as a newsletter
     """
-    logger.info(f"Starting newsletter analysis for {len(emails)} emails")
-    return identify_newsletters(emails)
+    return asyncio.run(aanalyze_newsletters(emails))
+
+async def aanalyze_newsletters(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Async variant of analyze_newsletters, for callers already running an event loop.
+    """
+    logger.info("Starting newsletter analysis for %s emails", len(emails))
+    
+    # aidentify_newsletters flags the emails in place, using cached verdicts where it can
+    try:
+        await aidentify_newsletters(emails)
+    except Exception as e:
+        logger.error("Error identifying newsletters: %s", e)
+    
+    # Emails the LLM failed to classify are left out, as before
+    return [email for email in emails if 'is_newsletter' in email]
 
 def summarize_newsletters(newsletters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Tool to generate concise summaries of newsletters.
     
+    Summaries are cached per email, so only newsletters not seen before are sent to the LLM.
+    
     Args:
         newsletters (List[Dict[str, Any]]): List of newsletter dictionaries containing:
             - subject (str): Email subject
@@ -145,8 +697,80 @@ def summarize_newsletters(newsletters: List[Dict[str, Any]]) -> List[Dict[str, A
             - is_newsletter (bool): Whether the email is identified as a newsletter
             - summary (str): Generated summary of the newsletter content
     """
-    logger.info(f"Starting newsletter summarization for {len(newsletters)} newsletters")
-    return generate_summaries(newsletters)
+    return asyncio.run(asummarize_newsletters(newsletters))
+
+async def asummarize_newsletters(newsletters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Async variant of summarize_newsletters, for callers already running an event loop.
+    """
+    logger.info("Starting newsletter summarization for %s newsletters", len(newsletters))
+    
+    uncached = []
+    keys = []
+    all_keys = [email_cache_key(newsletter) for newsletter in newsletters]
+    cached = SUMMARY_CACHE.get_many(all_keys)
+    for newsletter, key in zip(newsletters, all_keys):
+        if key in cached:
+            newsletter['summary'] = cached[key]
+        else:
+            uncached.append(newsletter)
+            keys.append(key)
+    logger.info("Found cached summaries for %s newsletters", len(newsletters) - len(uncached))
+    
+    if uncached:
+        # Identical newsletters (e.g. the same issue from two lists) are summarized once
+        unique = {}
+        for newsletter, key in zip(uncached, keys):
+            unique.setdefault(key, newsletter)
+        
+        # Summaries are generated concurrently and added to each newsletter in place
+        await agenerate_summaries(list(unique.values()))
+        for newsletter, key in zip(uncached, keys):
+            newsletter['summary'] = unique[key]['summary']
+        SUMMARY_CACHE.set_many((key, newsletter['summary']) for key, newsletter in unique.items())
+    
+    return newsletters
+
+def classify_and_summarize(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Tool to identify newsletters and summarize them in one step.
+    
+    Emails are classified with batched LLM calls, then only the newsletters are
+    summarized, also in batches. The verdict and summary caches are shared with
+    analyze_newsletters and summarize_newsletters, so emails already processed
+    by either path are reused.
+    
+    Args:
+        emails (List[Dict[str, Any]]): List of email dictionaries containing:
+            - subject (str): Email subject
+            - from (str): Sender email
+            - content (str): Email content
+        
+    Returns:
+        List[Dict[str, Any]]: List of emails with added fields:
+            - subject (str): Email subject
+            - from (str): Sender email
+            - content (str): Email content
+            - is_newsletter (bool): Whether the email is identified as a newsletter
+            - summary (str): Generated summary, for newsletters only
+    """
+    return asyncio.run(aclassify_and_summarize(emails))
+
+async def aclassify_and_summarize(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Async variant of classify_and_summarize, for callers already running an event loop.
+    """
+    logger.info("Starting newsletter classification and summarization for %s emails", len(emails))
+    
+    # Emails are classified in batches, with cached verdicts reused, and only the
+    # newsletters among them are summarized, also in batches
+    await aidentify_newsletters(emails)
+    newsletters = [email for email in emails if email['is_newsletter']]
+    if newsletters:
+        await asummarize_newsletters(newsletters)
+    
+    logger.info("Identified and summarized %s newsletters out of %s emails", len(newsletters), len(emails))
+    return emails
 
 def format_digest(summarized_newsletters: List[Dict[str, Any]]) -> str:
     """
@@ -164,25 +788,11 @@ def format_digest(summarized_newsletters: List[Dict[str, Any]]) -> str:
         str: Markdown-formatted digest with introduction, newsletter sections, and conclusion
     """
     logger.info("Starting markdown digest creation")
-    
-    # Clean the newsletters data to handle encoding issues
-    cleaned_newsletters = []
-    for newsletter in summarized_newsletters:
-        cleaned = {}
-        for key, value in newsletter.items():
-            if isinstance(value, str):
-                # Replace or remove problematic characters while preserving most Unicode
-                value = value.encode('utf-8', errors='ignore').decode('utf-8')
-            cleaned[key] = value
-        cleaned_newsletters.append(cleaned)
-    
-    prompt = f"""
-    Create a well-formatted markdown digest of these newsletter summaries:
-    
-    {cleaned_newsletters}
-    
-    Format it as:
-    # Newsletter Digest
-    ...
+    return create_markdown_digest(summarized_newsletters) 
+
+async def aformat_digest(summarized_newsletters: List[Dict[str, Any]]) -> str:
+    """
+    Async variant of format_digest, for callers already running an event loop.
     """
-    return create_markdown_digest(summarized_newsletters) 
\ No newline at end of file
+    logger.info("Starting markdown digest creation")
+    return await acreate_markdown_digest(summarized_newsletters)
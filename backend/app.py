@@ -4,14 +4,15 @@ import sys
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import and setup logging first
-from backend.logging_config import setup_logging
-logger = setup_logging()
+import logging
 
-# Now import other modules after logging is configured
-from flask import Flask, jsonify, request
+from backend.logging_config import setup_logging
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from backend.agent.agent import invoke_agent
+from backend.agent.agent import invoke_agent, stream_agent
+from backend.agent.serialization import json_dumps
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 # Configure CORS to allow all methods and headers
@@ -35,26 +36,55 @@ def generate_digest():
         
     try:
         data = request.get_json()
-        logger.info(f"Received request with data: {data}")
+        logger.info("Received request with data: %s", data)
         
         email_count = data.get('emailCount', 10)  # Default to 10 if not specified
-        logger.info(f"Processing request for {email_count} emails")
+        logger.info("Processing request for %s emails", email_count)
         
         # Invoke the agent to process emails and generate digest
         digest = invoke_agent(email_count)
-        logger.info(f"Generated digest: {digest}")
+        logger.info("Generated digest: %s", digest)
         
         return jsonify({
             'status': 'success',
             'digest': digest
         })
     except Exception as e:
-        logger.error(f"Error generating digest: {str(e)}")
+        logger.error("Error generating digest: %s", e)
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+@app.route('/generate-digest/stream', methods=['POST', 'OPTIONS'])
+def generate_digest_stream():
+    """
+    Stream the digest as server-sent events while it is generated.
+    
+    Each event carries a JSON object: {"type": "chunk", "text": ...} for a piece
+    of the markdown digest, then {"type": "done"}, or {"type": "error", "message": ...}.
+    """
+    if request.method == 'OPTIONS':
+        # Handle preflight request
+        return '', 204
+    
+    def events():
+        try:
+            # Parsed inside the stream, so a missing or invalid body is reported as an error event
+            data = request.get_json()
+            logger.info("Received streaming request with data: %s", data)
+            email_count = data.get('emailCount', 10)  # Default to 10 if not specified
+            
+            for chunk in stream_agent(email_count):
+                yield f"data: {json_dumps({'type': 'chunk', 'text': chunk})}\n\n"
+            yield f"data: {json_dumps({'type': 'done'})}\n\n"
+        except Exception as e:
+            logger.error("Error streaming digest: %s", e)
+            yield f"data: {json_dumps({'type': 'error', 'message': str(e)})}\n\n"
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream')
+
 if __name__ == '__main__':
+    setup_logging()
     logger.info("Starting Flask server...")
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
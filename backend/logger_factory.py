@@ -1,33 +1,16 @@
 import logging
-import argparse
 import os
 import sys
 from typing import Optional
 
-# Parse command line arguments first
-parser = argparse.ArgumentParser(description='Gmail Newsletter Digest Backend')
-parser.add_argument('--log-level', 
-                   default='INFO',
-                   choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
-                   help='Set the logging level')
-args = parser.parse_args()
+from backend.logging_config import get_log_level
 
-# Configure logging immediately
-numeric_level = getattr(logging, args.log_level.upper(), None)
-if not isinstance(numeric_level, int):
-    raise ValueError(f'Invalid log level: {args.log_level}')
+# Read the log level from the environment, so importing this module never
+# touches sys.argv (which belongs to the server or test runner)
+numeric_level = get_log_level()
 
-# Remove any existing handlers
-root = logging.getLogger()
-for handler in root.handlers[:]:
-    root.removeHandler(handler)
-
-logging.basicConfig(
-    level=numeric_level,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-# Set the root logger level
-logging.getLogger().setLevel(numeric_level)
+# Handlers are installed by the entry points through setup_logging(), so importing
+# this module has no side effects
 
 class LoggerFactory:
     @classmethod
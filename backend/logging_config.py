@@ -1,27 +1,69 @@
+import atexit
 import logging
 import os
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def setup_logging():
-    """Configure logging for the application"""
+# Size at which agent.log is rotated, and how many old logs are kept
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+# Log level used when LOG_LEVEL is not set
+DEFAULT_LOG_LEVEL = 'DEBUG'
+
+_CONFIGURED = False
+
+def get_log_level(default=DEFAULT_LOG_LEVEL):
+    """Return the numeric log level named by LOG_LEVEL, default if unset"""
+    name = os.getenv('LOG_LEVEL', default).upper()
+    level = getattr(logging, name, None)
+    if not isinstance(level, int):
+        raise ValueError(f'Invalid log level: {name}')
+    return level
+
+def setup_logging(default_level=DEFAULT_LOG_LEVEL):
+    """Configure logging for the application, once per process.
+
+    Called from the entry points only, so importing the backend never writes to agent.log.
+    """
+    global _CONFIGURED
+    if _CONFIGURED:
+        return logging.getLogger(__name__)
+    
     # Create logs directory if it doesn't exist
     log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
     os.makedirs(log_dir, exist_ok=True)
     
-    # Configure root logger
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        encoding='utf-8',
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler(os.path.join(log_dir, 'agent.log'), encoding='utf-8')
-        ]
-    )
+    # Configure root logger, at default_level unless LOG_LEVEL says otherwise.
+    # Request threads only push records onto a queue; a listener thread writes them out.
+    level = get_log_level(default_level)
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.StreamHandler(sys.stdout),
+        RotatingFileHandler(
+            os.path.join(log_dir, 'agent.log'),
+            maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    # Flush queued records before the process exits
+    atexit.register(listener.stop)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(log_queue))
     
     # Disable Flask's default logging
     logging.getLogger('werkzeug').disabled = True
     
+    # The discovery cache warns on every service build when file_cache is unavailable
+    logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
+    
     # Get logger for this module
     logger = logging.getLogger(__name__)
     
@@ -29,5 +71,6 @@ def setup_logging():
     if sys.stdout.encoding != 'utf-8':
         sys.stdout.reconfigure(encoding='utf-8')
     
+    _CONFIGURED = True
     logger.info("Logging configured successfully")
     return logger 
\ No newline at end of file
@@ -1,82 +1,189 @@
+import asyncio
+import json
 import logging
 import os
 from dotenv import load_dotenv
-from agent.tools import fetch_emails, analyze_newsletters, summarize_newsletters, format_digest
+from logging_config import setup_logging
+from agent.tools import (
+    afetch_emails, afetch_full_emails, aanalyze_newsletters, asummarize_newsletters, aformat_digest,
+    warm_up_gmail
+)
+from agent.llm import generate_content_async
 
 logger = logging.getLogger(__name__)
 
-def test_gmail_connection():
-    """Test Gmail API connection and email fetching"""
+# Environment variables the tests cannot run without
+REQUIRED_VARS = ('GOOGLE_API_KEY',)
+
+_ENV_LOADED = False
+
+# Emails recorded by the last online run: the emails exactly as they were
+# classified, and the full bodies of the newsletters among them. Set
+# TEST_OFFLINE=1 to test the LLM components on them instead of fetching from
+# Gmail. Prompts identical to the recorded run are answered from the LLM
+# response cache, so Gemini and GOOGLE_API_KEY are only needed for prompts
+# that changed since, or once that cache has expired.
+SAMPLE_EMAILS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'sample_emails.json')
+SAMPLE_EMAIL_FIELDS = ('id', 'subject', 'from', 'content', 'bulk')
+OFFLINE = os.getenv('TEST_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+def sample_fields(emails):
+    """Copy the recorded fields of each email"""
+    return [{k: email[k] for k in SAMPLE_EMAIL_FIELDS if k in email} for email in emails]
+
+def save_sample_emails(emails, full_emails):
+    """Record the classified emails and the full newsletters for offline runs"""
+    os.makedirs(os.path.dirname(SAMPLE_EMAILS_PATH), exist_ok=True)
+    with open(SAMPLE_EMAILS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'emails': emails, 'full_emails': sample_fields(full_emails)}, f, indent=2)
+
+def load_sample_emails():
+    """Load the emails recorded by the last online run, or None if there is no recording"""
+    try:
+        with open(SAMPLE_EMAILS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+async def check_gmail_connection():
+    """Test Gmail API connection and email fetching, returning the emails or None on failure"""
     try:
         logger.info("Testing Gmail connection...")
-        emails = fetch_emails(num_emails=2)  # Fetch just 2 emails for testing
+        # Fetch just 2 emails for testing, headers and snippets are enough to classify them
+        emails = await afetch_emails(num_emails=2, metadata_only=True)
         if emails:
-            logger.info(f"Successfully fetched {len(emails)} emails")
-            logger.info(f"Sample email subject: {emails[0]['subject']}")
-            return True
+            logger.info("Successfully fetched %s emails", len(emails))
+            logger.info("Sample email subject: %s", emails[0]['subject'])
+            return emails
         else:
             logger.warning("No emails found")
-            return False
+            return None
     except Exception as e:
-        logger.error(f"Error testing Gmail connection: {str(e)}")
-        return False
+        logger.error("Error testing Gmail connection: %s", e)
+        return None
 
-def test_llm_components():
-    """Test LLM-based components"""
+async def check_llm_components(emails=None):
+    """Test LLM-based components, on the given emails or on freshly fetched ones"""
     try:
-        # First fetch some emails
         logger.info("Testing LLM components...")
-        emails = fetch_emails(num_emails=2)
+        sample = None
+        if OFFLINE:
+            sample = load_sample_emails()
+            if sample is None:
+                logger.error("No recorded fixture at %s, run the tests online once to record one", SAMPLE_EMAILS_PATH)
+                return False
+            emails = sample['emails']
+        elif emails is None:
+            emails = await afetch_emails(num_emails=2, metadata_only=True)
         if not emails:
             logger.error("No emails to test with")
             return False
 
-        # Test newsletter identification
+        # Test newsletter identification, recording the emails as they are classified
         logger.info("Testing newsletter identification...")
-        newsletters = analyze_newsletters(emails)
-        logger.info(f"Identified {len(newsletters)} newsletters")
+        recorded = sample_fields(emails)
+        newsletters = await aanalyze_newsletters(emails)
+        logger.info("Identified %s newsletters", len(newsletters))
+
+        # Bodies are fetched only for the emails classified as newsletters
+        newsletters = [n for n in newsletters if n['is_newsletter']]
+        if sample is not None:
+            full = {n['id']: n for n in sample['full_emails']}
+            newsletters = [{**n, **full[n['id']]} for n in newsletters if n['id'] in full]
+        else:
+            newsletters = await afetch_full_emails(newsletters)
+            save_sample_emails(recorded, newsletters)
 
         if newsletters:
-            # Test summarization
+            # Test summarization, newsletters are summarized concurrently
             logger.info("Testing newsletter summarization...")
-            summarized = summarize_newsletters(newsletters)
-            logger.info(f"Generated summaries for {len(summarized)} newsletters")
+            summarized = await asummarize_newsletters(newsletters)
+            logger.info("Generated summaries for %s newsletters", len(summarized))
 
             # Test digest formatting
             logger.info("Testing digest formatting...")
-            digest = format_digest(summarized)
+            digest = await aformat_digest(summarized)
             logger.info("Successfully generated digest")
             return True
         return False
     except Exception as e:
-        logger.error(f"Error testing LLM components: {str(e)}")
+        logger.error("Error testing LLM components: %s", e)
         return False
 
+async def run_tests():
+    """Run the Gmail test, then the LLM test on the emails it fetched"""
+    if OFFLINE:
+        logger.info("Skipping Gmail connection test in offline mode")
+        return True, await check_llm_components()
+    emails = await check_gmail_connection()
+    if emails is None:
+        return False, False
+    return True, await check_llm_components(emails)
+
+def check_repeated_event_loops():
+    """Call Gemini from two event loops in turn, as two digest requests in one process do"""
+    try:
+        # Each tool call starts its own loop with asyncio.run; the response cache
+        # is bypassed so that both loops reach Gemini
+        for run in range(2):
+            response = asyncio.run(generate_content_async(f"Reply with the number {run + 1} and nothing else"))
+            logger.info("Gemini call from event loop %s answered: %s", run + 1, response.text.strip())
+        return True
+    except Exception as e:
+        logger.error("Error calling Gemini from a second event loop: %s", e)
+        return False
+
+def load_env():
+    """Load environment variables from .env, once per process"""
+    global _ENV_LOADED
+    if not _ENV_LOADED:
+        load_dotenv()
+        _ENV_LOADED = True
+
 def main():
     """Run all tests"""
     # Load environment variables
-    load_dotenv()
+    load_env()
     
-    # Check for required environment variables
-    required_vars = ['GOOGLE_API_KEY']
-    missing_vars = [var for var in required_vars if not os.getenv(var)]
+    # After load_env, so LOG_LEVEL may come from .env. INFO unless LOG_LEVEL says
+    # otherwise; DEBUG also logs every Gmail HTTP call
+    setup_logging(default_level='INFO')
+    
+    # Check for required environment variables, set and non-empty. Offline runs
+    # only need Gemini for prompts the response cache cannot answer
+    missing_vars = [] if OFFLINE else [var for var in REQUIRED_VARS if not os.environ.get(var)]
     if missing_vars:
-        logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
+        logger.error("Missing required environment variables: %s", ', '.join(missing_vars))
         return False
 
     # Run tests
     logger.info("Starting component tests...")
     
+    # Refresh the OAuth token and load the discovery document before the tests need them
+    if not OFFLINE:
+        try:
+            warm_up_gmail()
+        except Exception as e:
+            logger.error("Error preparing Gmail client: %s", e)
+    
+    # The LLM test reuses the Gmail test's emails instead of fetching them again
+    gmail_ok, llm_ok = asyncio.run(run_tests())
+    
     # Test Gmail connection
-    if not test_gmail_connection():
+    if not gmail_ok:
         logger.error("Gmail connection test failed")
         return False
     
     # Test LLM components
-    if not test_llm_components():
+    if not llm_ok:
         logger.error("LLM components test failed")
         return False
     
+    # Test that a later pipeline in the same process can still reach Gemini
+    if not OFFLINE and not check_repeated_event_loops():
+        logger.error("Repeated event loop test failed")
+        return False
+    
     logger.info("All tests completed successfully!")
     return True
 
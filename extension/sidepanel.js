@@ -54,11 +54,11 @@ document.addEventListener('DOMContentLoaded', function() {
             updateProgress('Starting newsletter digest generation...');
             console.log('Sending request to generate newsletter digest...');
             
-            const response = await fetch('http://localhost:5000/generate-digest', {
+            const response = await fetch('http://localhost:5000/generate-digest/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'Accept': 'application/json'
+                    'Accept': 'text/event-stream'
                 },
                 body: JSON.stringify({
                     emailCount: emailCount
@@ -71,16 +71,43 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
-            console.log('Raw data received:', JSON.stringify(data, null, 2));
-            console.log('Digest content:', data.digest);
+            // Render the digest as it streams in, one server-sent event per chunk
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let digest = '';
+            let finished = false;
 
-            if (data.status === 'success') {
-                // Display newsletter digest
-                emailResults.innerHTML = formatNewsletterDigest(data.digest);
-                emailResults.style.display = 'block';
-            } else {
-                showError(data.message || 'Failed to generate newsletter digest');
+            while (!finished) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffer += decoder.decode(value, { stream: true });
+
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const event of events) {
+                    if (!event.startsWith('data: ')) {
+                        continue;
+                    }
+                    const message = JSON.parse(event.slice('data: '.length));
+                    if (message.type === 'chunk') {
+                        digest += message.text;
+                        emailResults.innerHTML = formatNewsletterDigest(digest);
+                        emailResults.style.display = 'block';
+                        loadingIndicator.style.display = 'none';
+                    } else if (message.type === 'error') {
+                        throw new Error(message.message || 'Failed to generate newsletter digest');
+                    } else if (message.type === 'done') {
+                        finished = true;
+                    }
+                }
+            }
+
+            console.log('Digest content:', digest);
+            if (!finished) {
+                throw new Error('Digest stream ended unexpectedly');
             }
         } catch (error) {
             console.error('Error:', error);